@@ -31,12 +31,100 @@
 
 SCRIPT_NAME = 'alibnotify'
 SCRIPT_AUTHOR = 'NikolasOliveira'
-SCRIPT_VERSION = '1.3.0'
+SCRIPT_VERSION = '1.20.0'
 SCRIPT_LICENSE = 'MIT'
 SCRIPT_DESC = 'Sends libnotify notifications upon events.'
 
 
+import time
+# Script load time is measured from here to the end of main().
+LOAD_STARTED = getattr(time, 'perf_counter', time.time)()
+
+
 # Changelog
+# 2026-10-17: v1.20.0 Add /alibnotify profile start [memory]|stop|dump [file]
+#                     to profile the print callback path with cProfile and
+#                     tracemalloc. Nothing is wrapped while it is off.
+# 2026-10-17: v1.19.0 Parse topics and CTCP actions with linear scanners,
+#                     a crafted CTCP line could make the regex backtrack for
+#                     seconds. bench/redos.py times the parsers.
+# 2026-10-17: v1.18.0 Count the notifications held back while muted instead
+#                     of printing a line for each, and show one digest
+#                     notification and line when unmuting.
+# 2026-10-17: v1.17.0 Skip notifications for the buffer shown in the current
+#                     window while the user typed within idle_threshold
+#                     seconds. The buffer and activity are cached, refreshed
+#                     by signals and a timer.
+# 2026-10-17: v1.16.0 Track the away state from the 305/306 replies and DCC
+#                     transfers from the xfer_add/xfer_ended signals, instead
+#                     of matching every printed line against text patterns.
+# 2026-10-17: v1.15.0 Honour the icon option, and pick icons per category
+#                     (icon_category), network (icon_network) or nick
+#                     (icon_dir avatars). Backends keep an LRU of decoded
+#                     icons, sent inline and revalidated by mtime.
+# 2026-10-17: v1.14.0 Normalize notification bodies: cut to max_length,
+#                     strip leftover color codes, collapse whitespace and
+#                     escape markup (escape_markup).
+# 2026-10-17: v1.13.0 Keep the last history_size notifications, shown or
+#                     suppressed, in a ring shown by /alibnotify history.
+#                     With history_file set they are also appended to a
+#                     file, which is replayed when the script loads.
+# 2026-10-17: v1.12.0 Add a keyword watchlist for public messages, compiled
+#                     into a single trie shaped regex whenever the
+#                     watchlist options change.
+# 2026-10-17: v1.11.0 Deliver pending notifications by urgency, then by
+#                     category (highlights and private messages first), and
+#                     shed categories over their category_quota per
+#                     quota_window seconds.
+# 2026-10-17: v1.10.0 Skip bouncer playback: lines older than
+#                     playback_max_age seconds or tagged with one of
+#                     playback_tags. Lines seen again with the same time
+#                     within dedup_ttl seconds (reconnects, several
+#                     clients) are skipped too.
+# 2026-10-17: v1.9.0 Store a timed mute as a deadline with a single timer,
+#                    instead of chaining a new countdown timer every minute.
+#                    Add the quiet_hours option to suspend notifications on
+#                    a schedule.
+# 2026-10-17: v1.8.1 Import the libnotify bindings only when the first
+#                    notification is delivered, so the script loads without
+#                    them. /alibnotify stats reports the script load time.
+# 2026-10-17: v1.8.0 Add delivery backends, selected with the backend
+#                    option: libnotify (default), dbus (direct calls to
+#                    org.freedesktop.Notifications) and socket, which
+#                    forwards notifications to alibnotify_receiver.py over a
+#                    Unix or TCP connection (socket_address).
+# 2026-10-17: v1.7.0 Add /alibnotify stats: lines seen and dispatched per
+#                    category, notifications shown/muted/filtered/dropped,
+#                    delivery errors and latency histograms per stage. With
+#                    bar_stats on, the bar item shows a short summary.
+# 2026-10-17: v1.6.1 Cache buffer metadata per buffer pointer, invalidated
+#                    by the buffer rename/close/localvar signals.
+# 2026-10-17: v1.6.0 Match public_channel_whitelist entries exactly instead
+#                    of as substrings (#dev no longer allows #devops).
+#                    Entries can be qualified with the server
+#                    ("libera.#dev") and use * and ? wildcards.
+# 2026-10-17: v1.5.0 Rate limit notifications per category and source with
+#                    a token bucket (rate_burst per rate_window seconds,
+#                    rate_priority_burst for highlights and private
+#                    messages). Messages over the limit are summarized in a
+#                    single notification at the end of the window.
+# 2026-10-17: v1.4.1 Initialize libnotify once per session and update the
+#                    bubble of a repeated source in place instead of
+#                    opening a new one for every message.
+# 2026-10-17: v1.4.0 Deliver notifications from a background worker fed by
+#                    a bounded queue (queue_depth), so a slow notification
+#                    daemon no longer stalls WeeChat. queue_overflow picks
+#                    which notification is dropped when the queue is full:
+#                    drop_oldest or drop_lowest (urgency).
+# 2026-10-17: v1.3.3 Replace the catch-all print hook with narrow hooks
+#                    filtered by tags (or the core buffer for xfer lines),
+#                    registered only for enabled categories.
+# 2026-10-17: v1.3.2 Compile message patterns once at load, route tagged
+#                    lines through a tag index and guard the untagged
+#                    patterns with a literal prefix check.
+# 2026-10-17: v1.3.1 Keep a parsed snapshot of the plugin options, refreshed
+#                    by a config hook, instead of reading every option for
+#                    each printed line.
 # 2017-03-16: v1.3.0 Add alibnotify bar item. It shows mute state if
 #                    muted, so the user doesn't forget that their
 #                    notificaitions are muted. It will also display the minutes
@@ -74,6 +162,35 @@ SETTINGS = {
     'sticky': 'off',
     'sticky_away': 'on',
     'icon': '/usr/share/pixmaps/weechat.xpm',
+    'queue_depth': '32',
+    'queue_overflow': 'drop_oldest',
+    'rate_burst': '5',
+    'rate_priority_burst': '20',
+    'rate_window': '10',
+    'bar_stats': 'off',
+    'backend': 'libnotify',
+    'socket_address': '',
+    'socket_buffer': '256',
+    'quiet_hours': '',
+    'playback_max_age': '300',
+    'playback_tags': 'irc_batch_type_chathistory,'
+                     'irc_batch_type_znc.in/playback',
+    'dedup_cache_size': '256',
+    'dedup_ttl': '600',
+    'category_quota': '',
+    'quota_window': '60',
+    'watchlist': '',
+    'watchlist_whole_word': 'on',
+    'watchlist_ignore_case': 'on',
+    'history_size': '100',
+    'history_file': '',
+    'max_length': '256',
+    'escape_markup': 'on',
+    'icon_category': '',
+    'icon_network': '',
+    'icon_dir': '',
+    'icon_cache_size': '32',
+    'idle_threshold': '60',
 }
 
 
@@ -81,9 +198,20 @@ SETTINGS = {
 # Imports
 # -----------------------------------------------------------------------------
 try:
+    import base64
+    import collections
+    import datetime
+    import fnmatch
+    import heapq
+    import itertools
+    import json
+    import math
+    import os
     import re
+    import socket
+    import struct
+    import threading
     import weechat
-    import pynotify
     IMPORT_OK = True
 except ImportError as error:
     IMPORT_OK = False
@@ -96,90 +224,613 @@ except ImportError as error:
 # -----------------------------------------------------------------------------
 # Globals
 # -----------------------------------------------------------------------------
+# Backend neutral urgencies, with the values used by libnotify and the
+# org.freedesktop.Notifications urgency hint.
+URGENCY_LOW = 0
+URGENCY_NORMAL = 1
+URGENCY_CRITICAL = 2
+
+
 TAGGED_MESSAGES = {
     'public message or action': set(['irc_privmsg', 'notify_message']),
     'private message or action': set(['irc_privmsg', 'notify_private']),
     'notice message': set(['irc_notice', 'notify_private']),
     'invite message': set(['irc_invite', 'notify_highlight']),
     'channel topic': set(['irc_topic', ]),
-    #'away status': set(['away_info', ]),
 }
 
 
-UNTAGGED_MESSAGES = {
-    'away status':
-        re.compile(r'^You ((\w+).){2,3}marked as being away', re.UNICODE),
-    'dcc chat request':
-        re.compile(r'^xfer: incoming chat request from (\w+)', re.UNICODE),
-    'dcc chat closed':
-        re.compile(r'^xfer: chat closed with (\w+)', re.UNICODE),
-    'dcc get request':
-        re.compile(
-            r'^xfer: incoming file from (\w+) [^:]+: ((?:,\w|[^,])+),',
-            re.UNICODE),
-    'dcc get completed':
-        re.compile(r'^xfer: file ([^\s]+) received from \w+: OK', re.UNICODE),
-    'dcc get failed':
-        re.compile(
-            r'^xfer: file ([^\s]+) received from \w+: FAILED',
-            re.UNICODE),
-    'dcc send completed':
-        re.compile(r'^xfer: file ([^\s]+) sent to \w+: OK', re.UNICODE),
-    'dcc send failed':
-        re.compile(r'^xfer: file ([^\s]+) sent to \w+: FAILED', re.UNICODE),
+# Events reported by signals rather than printed lines, counted with the
+# dispatched lines by /alibnotify stats.
+SIGNAL_EVENTS = ('away status', 'dcc transfer')
+
+
+# xfer type_string values of the transfers WeeChat receives.
+XFER_RECV_TYPES = ('file_recv_active', 'file_recv_passive', 'chat_recv')
+
+
+# Message text is controlled by other users, so every pattern here must run
+# in linear time: anchored, with no two ways to match the same text. The
+# topics and CTCP actions are split by parse_topic and parse_ctcp_action,
+# bench/redos.py times all of them on adversarial input.
+ACTION_REGEX = re.compile(r'^(\w+) (.+)$', re.UNICODE)
+NOTICE_REGEX = re.compile(r'^([^\s]*) [^:]*: (.+)$', re.UNICODE)
+INVITE_REGEX = re.compile(
+    r'^You have been invited to ([^\s]+) by ([^\s]+)$', re.UNICODE)
+TOPIC_HEAD_REGEX = re.compile(
+    r'^\w+ has (?:changed|unset) topic for ([^\s]+)', re.UNICODE)
+# A quote ending a quoted topic, one which doesn't start a word.
+TOPIC_END_REGEX = re.compile(r'"(?!\w)', re.UNICODE)
+
+
+# Formatting codes left after WeeChat stripped its own colors: mIRC colors
+# with their numbers, attribute toggles and other control characters. Tabs
+# and newlines are left for the whitespace collapsing.
+CONTROL_CODES_REGEX = re.compile(
+    r'\x03(?:\d{1,2}(?:,\d{1,2})?)?|[\x00-\x08\x0b-\x1f\x7f]')
+
+
+# Narrow print hooks: (buffer, tags, message, options enabling the hook).
+# DCC chat lines are tagged like public messages, so the private options also
+# enable the public hook.
+PRINT_HOOKS = {
+    'public': ('', 'irc_privmsg+notify_message', '', (
+        'show_public_message', 'show_public_action_message', 'watchlist',
+        'show_private_message', 'show_private_action_message',
+        'show_highlighted_message')),
+    'private': ('', 'irc_privmsg+notify_private', '', (
+        'show_private_message', 'show_private_action_message',
+        'show_highlighted_message')),
+    'notice': ('', 'irc_notice+notify_private', '', (
+        'show_notice_message', 'show_highlighted_message')),
+    'invite': ('', 'irc_invite+notify_highlight', '', (
+        'show_invite_message', )),
+    'topic': ('', 'irc_topic', '', ('show_channel_topic', )),
 }
 
 
-DISPATCH_TABLE = {
-    'away status': 'set_away_status',
-    'public message or action': 'notify_public_message_or_action',
-    'private message or action': 'notify_private_message_or_action',
-    'notice message': 'notify_notice_message',
-    'invite message': 'notify_invite_message',
-    'channel topic': 'notify_channel_topic',
-    'dcc chat request': 'notify_dcc_chat_request',
-    'dcc chat closed': 'notify_dcc_chat_closed',
-    'dcc get request': 'notify_dcc_get_request',
-    'dcc get completed': 'notify_dcc_get_completed',
-    'dcc get failed': 'notify_dcc_get_failed',
-    'dcc send completed': 'notify_dcc_send_completed',
-    'dcc send failed': 'notify_dcc_send_failed',
-}
+DAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+QUIET_HOURS_REGEX = re.compile(
+    r'^(?:([a-z,-]+)\s+)?(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$')
+
+
+# Options which need the delivery backend to be reopened.
+BACKEND_OPTIONS = ('backend', 'socket_address', 'socket_buffer',
+                   'icon_cache_size')
+
+
+PRINT_HOOK_OPTIONS = set(
+    option for spec in PRINT_HOOKS.values() for option in spec[3])
 
 
 STATE = {
-    'icon': None,
     'is_away': False,
-    'is_muted': False
+    'is_muted': False,
+    'mute_deadline': None,
+    'mute_timer': None,
+    'is_quiet': False,
+    'quiet_timer': None,
+    'print_hooks': {},
+}
+
+
+# Parsed snapshot of the plugin options, refreshed by cb_config_changed.
+CONFIG = {}
+
+
+# The line being dispatched: (date, tags, buffer name, prefix, message),
+# and the metadata of its buffer.
+LINE = {
+    'context': None,
+    'buffer': None,
+}
+
+
+# Notifications held back while muted: [count, highest urgency] keyed by
+# (category, source), at most MUTED_MAX keys. The digest shown on unmute
+# lists the MUTED_DIGEST largest counts.
+MUTED = {}
+MUTED_MAX = 256
+MUTED_DIGEST = 5
+
+
+# The buffer shown in the current window and whether the user typed within
+# idle_threshold seconds, refreshed by signals and the activity timer rather
+# than queried for every line.
+ACTIVITY = {
+    'buffer': None,
+    'active': False,
+    'timer': None,
+}
+
+
+# Seconds between two reads of the inactivity info.
+ACTIVITY_INTERVAL = 5
+
+
+# /alibnotify profile state: the cProfile profiler, the functions replaced
+# by profiling wrappers, the nesting depth of the wrapped calls and the
+# tracemalloc snapshot taken when profiling started.
+PROFILE = {
+    'profiler': None,
+    'originals': {},
+    'depth': 0,
+    'snapshot': None,
+    'allocations': None,
+}
+
+
+# Lines of the profile report per section.
+PROFILE_TOP = 20
+
+
+# Module functions wrapped while profiling. WeeChat and the handlers look
+# them up by name, so replacing the globals is enough.
+PROFILED_FUNCTIONS = ('cb_process_message', 'a_notify')
+
+
+# Icons larger than this are left for the notification daemon to load.
+ICON_MAX_BYTES = 256 * 1024
+
+
+# Fingerprints of recently seen lines mapped to their expiry, oldest first.
+DEDUP = collections.OrderedDict()
+
+
+# Delivery order of the categories with the same urgency. Highlights and
+# then private messages go before every other category, whatever the
+# urgency of the others.
+CATEGORY_RANKS = dict((category, rank) for rank, category in enumerate((
+    'Highlight', 'Private', 'Invite', 'Watch', 'DCC', 'Action', 'Server',
+    'Channel', 'WeeChat', 'Notice', 'Public')))
+
+
+# Ring of the last history_size notifications: HistoryRecord or None slots,
+# the next slot to write, and the history file open for appending.
+HISTORY = {
+    'records': [],
+    'next': 0,
+    'file': None,
+}
+
+
+# Characters of a notification body kept in the history.
+HISTORY_BODY = 160
+
+
+# Watchlist keywords compiled by build_watchlist, None without keywords.
+WATCHLIST = {
+    'regex': None,
+    'ignore_case': False,
+}
+
+
+WATCHLIST_OPTIONS = ('watchlist', 'watchlist_ignore_case',
+                     'watchlist_whole_word')
+
+
+# Notifications queued per category in the current quota window.
+QUOTA = {
+    'window_started': 0,
+    'counts': {},
+}
+
+
+# Metadata of the buffers seen by cb_process_message, keyed by buffer
+# pointer and dropped by cb_buffer_changed.
+BUFFERS = {}
+
+
+# Heap of notifications waiting for the delivery worker, as (priority
+# class, -urgency, category rank, sequence, notification), and the errors
+# the worker hands back to the main thread through a pipe watched by
+# hook_fd. Every worker has its own stop event and pipe, so one still stuck
+# in a backend after a restart neither keeps running nor writes to its
+# successor's pipe.
+DELIVERY = {
+    'queue': [],
+    'sequence': itertools.count(),
+    'errors': collections.deque(),
+    'cond': threading.Condition(),
+    'running': False,
+    'stop': None,
+    'thread': None,
+    'pipe': None,
+    'fd_hook': None,
+}
+
+# Seconds before a backend which failed to open is tried again, doubled on
+# every failure. A missing binding is not retried until a backend option
+# changes and restarts the worker.
+BACKEND_RETRY_MIN = 5
+BACKEND_RETRY_MAX = 300
+
+
+# Token buckets per (category, source) and the messages they held back,
+# waiting to be summarized by cb_flush_summaries.
+RATE = {
+    'buckets': {},
+    'summaries': collections.OrderedDict(),
+    'timer': None,
+}
+
+
+# Categories given the rate_priority_burst budget, and the number of
+# buckets kept before full ones are forgotten.
+RATE_PRIORITY_CATEGORIES = ('Highlight', 'Private')
+RATE_BUCKETS_MAX = 1024
+
+
+MONOTONIC = getattr(time, 'monotonic', time.time)
+PERF_COUNTER = getattr(time, 'perf_counter', time.time)
+
+
+# Latency histograms have one bucket per power of two microseconds: bucket
+# N counts durations below 2**N us, the last one everything slower.
+LATENCY_BUCKETS = 18
+LATENCY_STAGES = ('dispatch', 'filtering', 'delivery')
+
+
+# Counters reported by /alibnotify stats.
+STATS = {
+    'lines': 0,
+    'playback': 0,
+    'duplicates': 0,
+    'dispatched': dict(
+        (key, 0) for key in list(TAGGED_MESSAGES) + list(SIGNAL_EVENTS)),
+    'shown': 0,
+    'muted': 0,
+    'focused': 0,
+    'filtered': 0,
+    'dropped': 0,
+    'errors': 0,
+    'load_time': 0.0,
+    'latency': dict(
+        (stage, [0] * LATENCY_BUCKETS) for stage in LATENCY_STAGES),
 }
 
 
+# Live notifications kept by the backends for in-place updates: how long a
+# sticky one is remembered (in seconds) and how many are remembered at most.
+LIVE_TTL = 600
+LIVE_MAX = 64
+
+
+# -----------------------------------------------------------------------------
+# Config
+# -----------------------------------------------------------------------------
+def parse_channel_list(value):
+    '''Split a comma separated option into a set of entries.'''
+    return set(item.strip() for item in value.split(',') if item.strip())
+
+
+def trie_pattern(node):
+    '''Turn a character trie into an unambiguous regex: alternatives at each
+    node start with different characters, so matching at a position costs
+    at most the length of the longest keyword.'''
+    branches = [re.escape(char) + trie_pattern(node[char])
+                for char in sorted(node) if char]
+    if not branches:
+        return ''
+    if len(branches) == 1 and '' not in node:
+        return branches[0]
+    return '(?:{0}){1}'.format('|'.join(branches), '?' if '' in node else '')
+
+
+def build_watchlist():
+    '''Compile the watchlist keywords into a single regex.'''
+    ignore_case = CONFIG['watchlist_ignore_case']
+    trie = {}
+    for keyword in CONFIG['watchlist']:
+        node = trie
+        for char in keyword.lower() if ignore_case else keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    if not trie:
+        WATCHLIST['regex'] = None
+        return
+    pattern = trie_pattern(trie)
+    if CONFIG['watchlist_whole_word']:
+        pattern = r'(?<!\w){0}(?!\w)'.format(pattern)
+    WATCHLIST['regex'] = re.compile(pattern, re.UNICODE)
+    WATCHLIST['ignore_case'] = ignore_case
+
+
+def parse_quota(value):
+    '''Parse "category:count" pairs into a dict keyed by category.'''
+    quota = {}
+    for entry in parse_channel_list(value):
+        category, _, count = entry.partition(':')
+        quota[category.strip().lower()] = int(count)
+    return quota
+
+
+def expand_path(path):
+    '''Expand "~" and "%h", the WeeChat directory, in a path option.'''
+    if '%h' in path:
+        path = path.replace('%h', weechat.info_get('weechat_dir', ''))
+    return os.path.expanduser(path)
+
+
+def parse_icon_map(value):
+    '''Parse "name:path" pairs into a dict of icon paths keyed by the
+    lowercased category or network name.'''
+    icons = {}
+    for entry in parse_channel_list(value):
+        name, _, path = entry.partition(':')
+        if not path:
+            raise ValueError(entry)
+        icons[name.strip().lower()] = expand_path(path.strip())
+    return icons
+
+
+def parse_whitelist(value):
+    '''Parse the channel whitelist into exact "#channel" and
+    "server.#channel" entries plus one regex for the wildcard entries.'''
+    entries = parse_channel_list(value)
+    patterns = [entry for entry in entries if '*' in entry or '?' in entry]
+    regex = None
+    if patterns:
+        regex = re.compile('|'.join(
+            '(?:{0})'.format(fnmatch.translate(pattern))
+            for pattern in patterns))
+    return {
+        'enabled': bool(entries),
+        'exact': entries.difference(patterns),
+        'regex': regex,
+    }
+
+
+def is_whitelisted(buffer_info):
+    '''Whether public messages in a buffer pass the channel whitelist. The
+    verdict is memoized in the buffer cache until the option changes.'''
+    verdict = buffer_info['whitelisted']
+    if verdict is None:
+        white_list = CONFIG['public_channel_whitelist']
+        channel = buffer_info['short_name']
+        qualified = '{0}.{1}'.format(buffer_info['server'], channel)
+        exact = white_list['exact']
+        regex = white_list['regex']
+        verdict = (
+            not white_list['enabled'] or
+            channel in exact or qualified in exact or
+            (regex is not None and (
+                regex.match(channel) is not None or
+                regex.match(qualified) is not None)))
+        buffer_info['whitelisted'] = verdict
+    return verdict
+
+
+def parse_days(spec):
+    '''Parse "mon-fri" or "sat,sun" into a set of weekday numbers.'''
+    days = set()
+    for part in spec.split(','):
+        first, _, last = part.partition('-')
+        first = DAYS.index(first)
+        last = DAYS.index(last) if last else first
+        if last < first:
+            last += 7
+        days.update(day % 7 for day in range(first, last + 1))
+    return days
+
+
+def parse_quiet_hours(value):
+    '''Parse quiet hours, e.g. "mon-fri 22:00-07:00; sat,sun 23:00-09:00",
+    into (weekdays, start minute, length in minutes) windows. A window
+    belongs to the day it starts on.'''
+    windows = []
+    for entry in value.split(';'):
+        entry = entry.strip().lower()
+        if not entry:
+            continue
+        match = QUIET_HOURS_REGEX.match(entry)
+        try:
+            if not match:
+                raise ValueError
+            spec, start_h, start_m, end_h, end_m = match.groups()
+            days = parse_days(spec) if spec else set(range(7))
+            start = int(start_h) * 60 + int(start_m)
+            end = int(end_h) * 60 + int(end_m)
+            if max(int(start_h), int(end_h)) > 23 or \
+                    max(int(start_m), int(end_m)) > 59:
+                raise ValueError
+        except ValueError:
+            weechat.prnt('', 'alibnotify: invalid quiet_hours entry: '
+                         '{0}'.format(entry))
+            continue
+        windows.append((days, start, (end - start) % 1440 or 1440))
+    return windows
+
+
+# Options which are not simple on/off switches, mapped to their parsers.
+OPTION_PARSERS = {
+    'public_channel_whitelist': parse_whitelist,
+    'queue_depth': int,
+    'queue_overflow': str,
+    'rate_burst': int,
+    'rate_priority_burst': int,
+    'rate_window': int,
+    'backend': str,
+    'socket_address': str,
+    'socket_buffer': int,
+    'quiet_hours': parse_quiet_hours,
+    'playback_max_age': int,
+    'playback_tags': parse_channel_list,
+    'dedup_cache_size': int,
+    'dedup_ttl': int,
+    'category_quota': parse_quota,
+    'quota_window': int,
+    'watchlist': parse_channel_list,
+    'history_size': int,
+    'history_file': str,
+    'max_length': int,
+    'icon': expand_path,
+    'icon_category': parse_icon_map,
+    'icon_network': parse_icon_map,
+    'icon_dir': expand_path,
+    'icon_cache_size': int,
+    'idle_threshold': int,
+}
+
+
+def parse_option(option, value):
+    '''Convert a raw option string into the value stored in CONFIG.'''
+    parser = OPTION_PARSERS.get(option)
+    if parser:
+        try:
+            return parser(value)
+        except ValueError:
+            weechat.prnt('', 'alibnotify: invalid value for {0}: "{1}", '
+                         'using "{2}"'.format(option, value, SETTINGS[option]))
+            return parser(SETTINGS[option])
+    return value == 'on'
+
+
+def load_config():
+    '''Take a snapshot of every plugin option.'''
+    for option in SETTINGS:
+        CONFIG[option] = parse_option(
+            option, weechat.config_get_plugin(option))
+    build_watchlist()
+
+
+def cb_config_changed(data, option, value):
+    '''Refresh the CONFIG entry for a changed plugin option.'''
+    name = option.rsplit('.', 1)[-1]
+    if name in SETTINGS:
+        CONFIG[name] = parse_option(name, value)
+    if name == 'public_channel_whitelist':
+        for buffer_info in BUFFERS.values():
+            buffer_info['whitelisted'] = None
+    if name in PRINT_HOOK_OPTIONS:
+        register_print_hooks()
+    if name in WATCHLIST_OPTIONS:
+        build_watchlist()
+    if name == 'quiet_hours':
+        apply_quiet_hours()
+    if name == 'idle_threshold':
+        apply_idle_threshold()
+    if name == 'history_size':
+        resize_history()
+    if name in ('history_size', 'history_file'):
+        open_history_file()
+    if name in BACKEND_OPTIONS and DELIVERY['running']:
+        stop_delivery()
+        start_delivery()
+    return weechat.WEECHAT_RC_OK
+
+
+def register_print_hooks():
+    '''Hook the lines of every enabled category and unhook the others.'''
+    hooks = STATE['print_hooks']
+    for name, (wbuffer, tags, message, options) in PRINT_HOOKS.items():
+        enabled = any(CONFIG[option] for option in options)
+        if enabled and name not in hooks:
+            hooks[name] = weechat.hook_print(
+                wbuffer, tags, message, 1, 'cb_process_message', '')
+        elif not enabled and name in hooks:
+            weechat.unhook(hooks.pop(name))
+
+
+# -----------------------------------------------------------------------------
+# Stats
+# -----------------------------------------------------------------------------
+def record_latency(stage, start):
+    '''Count the time elapsed since start in the histogram of a stage.'''
+    micros = int((PERF_COUNTER() - start) * 1000000)
+    STATS['latency'][stage][
+        min(micros.bit_length(), LATENCY_BUCKETS - 1)] += 1
+
+
+def histogram_percentile(buckets, fraction):
+    '''Upper bound in microseconds of the bucket holding a percentile.'''
+    total = sum(buckets)
+    if not total:
+        return 0
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= fraction * total:
+            break
+    return 2 ** index
+
+
+def format_histogram(buckets):
+    '''Summarize a latency histogram on one line.'''
+    total = sum(buckets)
+    if not total:
+        return 'no samples'
+    last = max(index for index, count in enumerate(buckets) if count)
+    text = '{0} samples, p50 < {1}us, p99 < {2}us, max < {3}us'.format(
+        total, histogram_percentile(buckets, 0.5),
+        histogram_percentile(buckets, 0.99), 2 ** last)
+    if last == LATENCY_BUCKETS - 1:
+        text += '+'
+    return text
+
+
+def print_stats(buffer):
+    '''Print the counters and latency histograms.'''
+    weechat.prnt(buffer, 'alibnotify stats:')
+    weechat.prnt(buffer, '  script load: {0:.1f}ms'.format(
+        STATS['load_time'] * 1000))
+    weechat.prnt(
+        buffer,
+        '  lines seen: {0} ({1} playback, {2} duplicates skipped)'.format(
+            STATS['lines'], STATS['playback'], STATS['duplicates']))
+    for key, count in sorted(STATS['dispatched'].items()):
+        if count:
+            weechat.prnt(buffer, '  {0}: {1}'.format(key, count))
+    weechat.prnt(
+        buffer,
+        '  notifications: {0} shown, {1} muted, {2} in the focused buffer, '
+        '{3} filtered, {4} dropped, {5} errors'.format(
+            STATS['shown'], STATS['muted'], STATS['focused'],
+            STATS['filtered'], STATS['dropped'], STATS['errors']))
+    for stage in LATENCY_STAGES:
+        weechat.prnt(buffer, '  {0} latency: {1}'.format(
+            stage, format_histogram(STATS['latency'][stage])))
+
+
+def reset_stats():
+    '''Zero every counter and histogram.'''
+    for key in ('lines', 'playback', 'duplicates', 'shown', 'muted',
+                'focused', 'filtered', 'dropped', 'errors'):
+        STATS[key] = 0
+    for key in STATS['dispatched']:
+        STATS['dispatched'][key] = 0
+    for buckets in STATS['latency'].values():
+        buckets[:] = [0] * LATENCY_BUCKETS
+
+
 # -----------------------------------------------------------------------------
 # Notifiers
 # -----------------------------------------------------------------------------
 def cb_irc_server_connected(data, signal, signal_data):
     '''Notify when connected to IRC server.'''
-    if weechat.config_get_plugin('show_server') == 'on':
+    if CONFIG['show_server']:
         a_notify(
             'Server',
             'Server Connected',
-            'Connected to network {0}.'.format(signal_data))
+            'Connected to network {0}.'.format(signal_data),
+            source=signal_data)
     return weechat.WEECHAT_RC_OK
 
 
 def cb_irc_server_disconnected(data, signal, signal_data):
     '''Notify when disconnected to IRC server.'''
-    if weechat.config_get_plugin('show_server') == 'on':
+    if CONFIG['show_server']:
         a_notify(
             'Server',
             'Server Disconnected',
-            'Disconnected from network {0}.'.format(signal_data))
+            'Disconnected from network {0}.'.format(signal_data),
+            source=signal_data)
     return weechat.WEECHAT_RC_OK
 
 
 def cb_notify_upgrade_ended(data, signal, signal_data):
     '''Notify on end of WeeChat upgrade.'''
-    if weechat.config_get_plugin('show_upgrade_ended') == 'on':
+    if CONFIG['show_upgrade_ended']:
         a_notify(
             'WeeChat',
             'WeeChat Upgraded',
@@ -187,114 +838,132 @@ def cb_notify_upgrade_ended(data, signal, signal_data):
     return weechat.WEECHAT_RC_OK
 
 
-def notify_highlighted_message(prefix, message):
-    '''Notify on highlighted message.'''
-    if weechat.config_get_plugin("show_highlighted_message") == "on":
+def notify_highlighted_message(prefix, message, buffer_info):
+    '''Notify on highlighted message. Highlights are rate limited per
+    buffer.'''
+    if CONFIG['show_highlighted_message']:
         a_notify(
             'Highlight',
             'Highlighted Message',
             "{0}: {1}".format(prefix, message),
-            priority=pynotify.URGENCY_CRITICAL)
+            priority=URGENCY_CRITICAL,
+            source=buffer_info['name'],
+            nick=prefix)
 
 
-def notify_public_message_or_action(prefix, message, highlighted, buffer_short_name):
+def notify_public_message_or_action(prefix, message, highlighted, buffer_info):
     '''Notify on public message or action.'''
     if prefix == ' *':
-        regex = re.compile(r'^(\w+) (.+)$', re.UNICODE)
-        match = regex.match(message)
+        match = ACTION_REGEX.match(message)
         if match:
             prefix = match.group(1)
             message = match.group(2)
-            notify_public_action_message(prefix, message, highlighted, buffer_short_name)
+            notify_public_action_message(prefix, message, highlighted, buffer_info)
     else:
         if highlighted:
-            notify_highlighted_message(prefix, message)
-        elif weechat.config_get_plugin("show_public_message") == "on":
-            # filter through channel whitelist
-            white_list = weechat.config_get_plugin("public_channel_whitelist")
-            if not white_list:
-                a_notify(
-                    'Public',
-                    'Public Message in %s' % buffer_short_name,
-                    '{0}: {1}'.format(prefix, message))
-            elif buffer_short_name in white_list:
-                a_notify(
-                    'Public',
-                    'Public Message in %s' % buffer_short_name,
-                    '{0}: {1}'.format(prefix, message))
-
+            notify_highlighted_message(prefix, message, buffer_info)
+        # filter through channel whitelist
+        elif CONFIG['show_public_message'] and is_whitelisted(buffer_info):
+            a_notify(
+                'Public',
+                'Public Message in %s' % buffer_info['short_name'],
+                '{0}: {1}'.format(prefix, message),
+                source=buffer_info['name'],
+                nick=prefix)
+        else:
+            notify_watched_message(prefix, message, buffer_info)
 
 
-def notify_private_message_or_action(prefix, message, highlighted, buffer_short_name):
+def notify_private_message_or_action(prefix, message, highlighted, buffer_info):
     '''Notify on private message or action.'''
-    regex = re.compile(r'^CTCP_MESSAGE.+?ACTION (.+)$', re.UNICODE)
-    match = regex.match(message)
-    if match:
-        notify_private_action_message(prefix, match.group(1), highlighted)
+    action = parse_ctcp_action(message)
+    if action:
+        notify_private_action_message(
+            prefix, action, highlighted, buffer_info)
     else:
         if prefix == ' *':
-            regex = re.compile(r'^(\w+) (.+)$', re.UNICODE)
-            match = regex.match(message)
+            match = ACTION_REGEX.match(message)
             if match:
                 prefix = match.group(1)
                 message = match.group(2)
-                notify_private_action_message(prefix, message, highlighted, buffer_short_name)
+                notify_private_action_message(prefix, message, highlighted, buffer_info)
         else:
             if highlighted:
-                notify_highlighted_message(prefix, message)
-            elif weechat.config_get_plugin("show_private_message") == "on":
+                notify_highlighted_message(prefix, message, buffer_info)
+            elif CONFIG['show_private_message']:
                 a_notify(
                     'Private',
                     'Private Message - %s' % prefix,
-                    message)
+                    message,
+                    source=prefix)
 
 
-def notify_public_action_message(prefix, message, highlighted, buffer_short_name):
+def notify_public_action_message(prefix, message, highlighted, buffer_info):
     '''Notify on public action message.'''
     if highlighted:
-        notify_highlighted_message(prefix, message)
-    elif weechat.config_get_plugin("show_public_action_message") == "on":
+        notify_highlighted_message(prefix, message, buffer_info)
+    elif CONFIG['show_public_action_message']:
         a_notify(
             'Action',
             'Public Action Message',
             '{0}: {1}'.format(prefix, message),
-            priority=pynotify.URGENCY_NORMAL)
+            priority=URGENCY_NORMAL,
+            source=buffer_info['name'],
+            nick=prefix)
+    else:
+        notify_watched_message(prefix, message, buffer_info)
+
+
+def notify_watched_message(prefix, message, buffer_info):
+    '''Notify on public message containing a watchlist keyword.'''
+    regex = WATCHLIST['regex']
+    if regex is None:
+        return
+    # Lowering the message is cheaper than a case insensitive regex.
+    text = message.lower() if WATCHLIST['ignore_case'] else message
+    if regex.search(text):
+        a_notify(
+            'Watch',
+            'Watched Keyword in %s' % buffer_info['short_name'],
+            '{0}: {1}'.format(prefix, message),
+            priority=URGENCY_NORMAL,
+            source=buffer_info['name'],
+            nick=prefix)
 
 
-def notify_private_action_message(prefix, message, highlighted, buffer_short_name):
+def notify_private_action_message(prefix, message, highlighted, buffer_info):
     '''Notify on private action message.'''
     if highlighted:
-        notify_highlighted_message(prefix, message)
-    elif weechat.config_get_plugin("show_private_action_message") == "on":
+        notify_highlighted_message(prefix, message, buffer_info)
+    elif CONFIG['show_private_action_message']:
         a_notify(
             'Action',
             'Private Action Message',
             '{0}: {1}'.format(prefix, message),
-            priority=pynotify.URGENCY_NORMAL)
+            priority=URGENCY_NORMAL,
+            source=prefix)
 
 
-def notify_notice_message(prefix, message, highlighted, buffer_short_name):
+def notify_notice_message(prefix, message, highlighted, buffer_info):
     '''Notify on notice message.'''
-    regex = re.compile(r'^([^\s]*) [^:]*: (.+)$', re.UNICODE)
-    match = regex.match(message)
+    match = NOTICE_REGEX.match(message)
     if match:
         prefix = match.group(1)
         message = match.group(2)
         if highlighted:
-            notify_highlighted_message(prefix, message)
-        elif weechat.config_get_plugin("show_notice_message") == "on":
+            notify_highlighted_message(prefix, message, buffer_info)
+        elif CONFIG['show_notice_message']:
             a_notify(
                 'Notice',
                 'Notice Message',
-                '{0}: {1}'.format(prefix, message))
+                '{0}: {1}'.format(prefix, message),
+                source=prefix)
 
 
-def notify_invite_message(prefix, message, highlighted, buffer_short_name):
+def notify_invite_message(prefix, message, highlighted, buffer_info):
     '''Notify on channel invitation message.'''
-    if weechat.config_get_plugin("show_invite_message") == "on":
-        regex = re.compile(
-            r'^You have been invited to ([^\s]+) by ([^\s]+)$', re.UNICODE)
-        match = regex.match(message)
+    if CONFIG['show_invite_message']:
+        match = INVITE_REGEX.match(message)
         if match:
             channel = match.group(1)
             nick = match.group(2)
@@ -304,91 +973,221 @@ def notify_invite_message(prefix, message, highlighted, buffer_short_name):
                 '{0} has invited you to join {1}.'.format(nick, channel))
 
 
-def notify_channel_topic(prefix, message, highlighted, buffer_short_name):
+def notify_channel_topic(prefix, message, highlighted, buffer_info):
     '''Notify on channel topic change.'''
-    if weechat.config_get_plugin("show_channel_topic") == "on":
-        regex = re.compile(
-            r'^\w+ has (?:changed|unset) topic for ([^\s]+)' +
-                '(?:(?: from "(?:(?:"\w|[^"])+)")? to "((?:"\w|[^"])+)")?',
-            re.UNICODE)
-        match = regex.match(message)
-        if match:
-            channel = match.group(1)
-            topic = match.group(2) or ''
+    if CONFIG['show_channel_topic']:
+        parsed = parse_topic(message)
+        if parsed:
+            channel, topic = parsed
             a_notify(
                 'Channel',
                 'Channel Topic',
                 "{0}: {1}".format(channel, topic))
 
 
-def notify_dcc_chat_request(match):
+def notify_dcc_chat_request(nick):
     '''Notify on DCC chat request.'''
-    if weechat.config_get_plugin("show_dcc") == "on":
-        nick = match.group(1)
+    if CONFIG['show_dcc']:
         a_notify(
             'DCC',
             'Direct Chat Request',
             '{0} wants to chat directly.'.format(nick))
 
 
-def notify_dcc_chat_closed(match):
+def notify_dcc_chat_closed(nick):
     '''Notify on DCC chat termination.'''
-    if weechat.config_get_plugin("show_dcc") == "on":
-        nick = match.group(1)
+    if CONFIG['show_dcc']:
         a_notify(
             'DCC',
             'Direct Chat Ended',
             'Direct chat with {0} has ended.'.format(nick))
 
 
-def notify_dcc_get_request(match):
+def notify_dcc_get_request(nick, file_name):
     'Notify on DCC get request.'
-    if weechat.config_get_plugin("show_dcc") == "on":
-        nick = match.group(1)
-        file_name = match.group(2)
+    if CONFIG['show_dcc']:
         a_notify(
             'DCC',
             'File Transfer Request',
             '{0} wants to send you {1}.'.format(nick, file_name))
 
 
-def notify_dcc_get_completed(match):
+def notify_dcc_get_completed(file_name):
     'Notify on DCC get completion.'
-    if weechat.config_get_plugin("show_dcc") == "on":
-        file_name = match.group(1)
+    if CONFIG['show_dcc']:
         a_notify('DCC', 'Download Complete', file_name)
 
 
-def notify_dcc_get_failed(match):
+def notify_dcc_get_failed(file_name):
     'Notify on DCC get failure.'
-    if weechat.config_get_plugin("show_dcc") == "on":
-        file_name = match.group(1)
+    if CONFIG['show_dcc']:
         a_notify('DCC', 'Download Failed', file_name)
 
 
-def notify_dcc_send_completed(match):
+def notify_dcc_send_completed(file_name):
     'Notify on DCC send completion.'
-    if weechat.config_get_plugin("show_dcc") == "on":
-        file_name = match.group(1)
+    if CONFIG['show_dcc']:
         a_notify('DCC', 'Upload Complete', file_name)
 
 
-def notify_dcc_send_failed(match):
+def notify_dcc_send_failed(file_name):
     'Notify on DCC send failure.'
-    if weechat.config_get_plugin("show_dcc") == "on":
-        file_name = match.group(1)
+    if CONFIG['show_dcc']:
         a_notify('DCC', 'Upload Failed', file_name)
 
 
 # -----------------------------------------------------------------------------
 # Utility
 # -----------------------------------------------------------------------------
-def set_away_status(match):
-    status = match.group(1)
-    if status == 'been ':
-        STATE['is_away'] = True
-    if status == 'longer ':
-        STATE['is_away'] = False
+def xfer_info(infolist):
+    '''Read the type, status, nick and file name of the transfer in the
+    infolist sent with an xfer signal.'''
+    if not infolist or not weechat.infolist_next(infolist):
+        return None
+    return (weechat.infolist_string(infolist, 'type_string'),
+            weechat.infolist_string(infolist, 'status_string'),
+            weechat.infolist_string(infolist, 'remote_nick'),
+            weechat.infolist_string(infolist, 'filename'))
+
+
+def parse_ctcp_action(message):
+    '''Return the text of a CTCP ACTION line, or None.'''
+    if not message.startswith('CTCP_MESSAGE'):
+        return None
+    index = message.find('ACTION ', 13)
+    if index == -1:
+        return None
+    return message[index + 7:] or None
+
+
+def parse_topic(message):
+    '''Split a topic change line into the channel and the new topic, empty
+    when unset, or return None. Scans from left to right, each character is
+    looked at a bounded number of times.'''
+    match = TOPIC_HEAD_REGEX.match(message)
+    if not match:
+        return None
+    channel = match.group(1)
+    rest = message[match.end():]
+    start = None
+    if rest.startswith(' to "'):
+        start = 5
+    elif rest.startswith(' from "'):
+        # The old topic can't contain the quote ending it, so it ends at
+        # the first quote which doesn't start a word.
+        end = TOPIC_END_REGEX.search(rest, 7)
+        if end and end.start() > 7 and \
+                rest.startswith('" to "', end.start()):
+            start = end.start() + 6
+    if start is not None:
+        end = topic_end(rest, start)
+        if end > start:
+            return channel, rest[start:end]
+    return channel, ''
+
+
+def topic_end(text, start):
+    '''Return the index of the quote closing a topic quoted from start, or
+    -1: the last quote up to the first one which doesn't start a word.'''
+    end = TOPIC_END_REGEX.search(text, start)
+    return text.rfind('"', start + 1, end.end() if end else len(text))
+
+
+def get_buffer_info(wbuffer):
+    '''Look up and cache the metadata of a buffer.'''
+    name = weechat.buffer_get_string(wbuffer, 'name')
+    buffer_info = BUFFERS[wbuffer] = {
+        'name': name,
+        'pointer': wbuffer,
+        'short_name': weechat.buffer_get_string(wbuffer, 'short_name'),
+        'server': weechat.buffer_get_string(wbuffer, 'localvar_server'),
+        'type': weechat.buffer_get_string(wbuffer, 'localvar_type'),
+        'is_dcc': name.startswith('irc_dcc.'),
+        'whitelisted': None,
+    }
+    return buffer_info
+
+
+def is_replayed(date, tags, buffer_name, prefix, message):
+    '''Whether a line is bouncer playback, either too old, tagged as
+    playback or already seen within dedup_ttl. Replayed lines keep their
+    original server time, so the date is part of the fingerprint and a
+    nick repeating a message later is not taken for a replay.'''
+    max_age = CONFIG['playback_max_age']
+    date = int(date or 0)
+    if max_age > 0 and date and time.time() - date > max_age:
+        STATS['playback'] += 1
+        return True
+    for tag in CONFIG['playback_tags']:
+        if tag in tags and tag in tags.split(','):
+            STATS['playback'] += 1
+            return True
+    if is_duplicate((date, buffer_name, prefix, hash(message))):
+        STATS['duplicates'] += 1
+        return True
+    return False
+
+
+def is_duplicate(fingerprint):
+    '''Remember a line fingerprint, returning whether it was already seen
+    within dedup_ttl. The cache keeps at most dedup_cache_size entries.'''
+    size = CONFIG['dedup_cache_size']
+    if size <= 0:
+        return False
+    cache = DEDUP
+    now = MONOTONIC()
+    expires = cache.pop(fingerprint, None)
+    if expires is not None and expires > now:
+        cache[fingerprint] = expires
+        return True
+    cache[fingerprint] = now + CONFIG['dedup_ttl']
+    while len(cache) > size:
+        cache.popitem(last=False)
+    # Entries are in insertion order, so the oldest one is at the front.
+    # Dropping one expired entry per insert keeps up with the inserts.
+    oldest = next(iter(cache))
+    if cache[oldest] <= now:
+        del cache[oldest]
+    return False
+
+
+# -----------------------------------------------------------------------------
+# Dispatch
+# -----------------------------------------------------------------------------
+DISPATCH_TABLE = {
+    'public message or action': notify_public_message_or_action,
+    'private message or action': notify_private_message_or_action,
+    'notice message': notify_notice_message,
+    'invite message': notify_invite_message,
+    'channel topic': notify_channel_topic,
+}
+
+
+def build_tag_index():
+    '''Index TAGGED_MESSAGES by their irc_* command tag.'''
+    index = {}
+    for key, required in TAGGED_MESSAGES.items():
+        for tag in required:
+            if tag.startswith('irc_'):
+                index.setdefault(tag, []).append((key, required))
+    return index
+
+
+TAG_INDEX = build_tag_index()
+
+
+def route_tags(tags):
+    '''Return the TAGGED_MESSAGES key matching the tags of a line, if any.'''
+    tags = tags.split(',')
+    for tag in tags:
+        candidates = TAG_INDEX.get(tag)
+        if candidates:
+            tags = set(tags)
+            for key, required in candidates:
+                if tags.issuperset(required):
+                    return key
+            return None
+    return None
 
 
 def cb_process_message(
@@ -402,110 +1201,1224 @@ def cb_process_message(
     message
 ):
     '''Delegates incoming messages to appropriate handlers.'''
-    tags = set(tags.split(','))
-    functions = globals()
-    is_public_message = tags.issuperset(
-        TAGGED_MESSAGES['public message or action'])
-    buffer_name = weechat.buffer_get_string(wbuffer, 'name')
-    buffer_short_name = weechat.buffer_get_string(wbuffer, 'short_name')
-    dcc_buffer_regex = re.compile(r'^irc_dcc\.', re.UNICODE)
-    dcc_buffer_match = dcc_buffer_regex.match(buffer_name)
+    start = PERF_COUNTER()
+    STATS['lines'] += 1
+    dispatch_message(wbuffer, date, tags, highlight, prefix, message)
+    record_latency('dispatch', start)
+    return weechat.WEECHAT_RC_OK
+
+
+def dispatch_message(wbuffer, date, tags, highlight, prefix, message):
+    '''Pass a printed line to the handler of its category.'''
+    key = route_tags(tags)
+    buffer_info = BUFFERS.get(wbuffer) or get_buffer_info(wbuffer)
+    # Checked by a_notify, only for lines which produce a notification.
+    LINE['context'] = (date, tags, buffer_info['name'], prefix, message)
+    LINE['buffer'] = buffer_info
+    try:
+        dispatch_line(key, buffer_info, highlight, prefix, message)
+    finally:
+        LINE['context'] = None
+        LINE['buffer'] = None
+
+
+def dispatch_line(key, buffer_info, highlight, prefix, message):
+    '''Call the handler of a routed line.'''
     highlighted = False
     if int(highlight):
         highlighted = True
     # Private DCC message identifies itself as public.
-    if is_public_message and dcc_buffer_match:
-        notify_private_message_or_action(prefix, message, highlighted, buffer_short_name)
-        return weechat.WEECHAT_RC_OK
-    # Pass identified, untagged message to its designated function.
-    for key, value in UNTAGGED_MESSAGES.items():
-        match = value.match(message)
-        if match:
-            functions[DISPATCH_TABLE[key]](match)
-            return weechat.WEECHAT_RC_OK
+    if key == 'public message or action' and buffer_info['is_dcc']:
+        STATS['dispatched']['private message or action'] += 1
+        notify_private_message_or_action(prefix, message, highlighted, buffer_info)
+        return
     # Pass identified, tagged message to its designated function.
-    for key, value in TAGGED_MESSAGES.items():
-        if tags.issuperset(value):
-            functions[DISPATCH_TABLE[key]](prefix, message, highlighted, buffer_short_name)
-            return weechat.WEECHAT_RC_OK
-    return weechat.WEECHAT_RC_OK
-
-
-def a_notify(notification, title, description, priority=pynotify.URGENCY_LOW):
-    '''Assemble and show the notification'''
-    is_away = STATE['is_away']
-    if STATE['is_muted']:
-        weechat.prnt('', 'alibnotify is currently muted, '
-                     'not showing notification. Unmute with: /alibnotify mute')
+    if key:
+        STATS['dispatched'][key] += 1
+        DISPATCH_TABLE[key](prefix, message, highlighted, buffer_info)
+
+
+def a_notify(notification, title, description, priority=URGENCY_LOW,
+             source='', nick=''):
+    '''Assemble and show the notification. Notifications sharing a non empty
+    source within a category update the same bubble and are rate limited'''
+    start = PERF_COUNTER()
+    context = LINE['context']
+    if context is not None and is_replayed(*context):
+        record_history(notification, source, title, description, 'replayed')
+        return
+    buffer_info = LINE['buffer']
+    pointer = buffer_info and buffer_info['pointer']
+    if is_held_back(notification, source, title, description, priority,
+                    pointer):
+        return
+    description = normalize_body(description)
+    if source and not take_token(
+            notification, source, nick, priority, pointer):
+        STATS['filtered'] += 1
+        record_history(
+            notification, source, title, description, 'rate limited')
+        record_latency('filtering', start)
         return
-    icon = STATE['icon']
+    record_latency('filtering', start)
+    enqueue_for_display(notification, source, title, description, priority,
+                        nick or source, buffer_info and buffer_info['server'])
+    if CONFIG['bar_stats']:
+        weechat.bar_item_update(SCRIPT_NAME)
+
+
+def is_held_back(notification, source, title, description, priority,
+                 pointer, count=1):
+    '''Hold back a notification of the focused buffer while the user is
+    active, or any notification while muted or in quiet hours. A rate
+    limiter summary stands for count messages.'''
+    if ACTIVITY['active'] and pointer and pointer == ACTIVITY['buffer']:
+        STATS['focused'] += 1
+        record_history(notification, source, title, description, 'focused')
+        return True
+    if STATE['is_muted']:
+        STATS['muted'] += 1
+        count_muted(notification, source, priority, count)
+        record_history(notification, source, title, description, 'muted')
+        return True
+    if STATE['is_quiet']:
+        STATS['muted'] += 1
+        record_history(notification, source, title, description, 'quiet')
+        return True
+    return False
+
+
+def normalize_body(text):
+    '''Make a notification body short and safe to display: cut it to
+    max_length characters, strip leftover color codes and collapse
+    whitespace. Only a slice of max_length * 4 characters is looked
+    at, so a huge paste costs no more than a line of that length.'''
+    limit = CONFIG['max_length']
+    clipped = False
+    if limit > 0 and len(text) > limit * 4:
+        text = text[:limit * 4]
+        clipped = True
+    text = weechat.string_remove_color(text, '')
+    text = CONTROL_CODES_REGEX.sub('', text)
+    text = ' '.join(text.split())
+    if limit > 0 and len(text) > limit:
+        text = text[:max(limit - 3, 0)].rstrip()
+        clipped = True
+    if clipped:
+        text += '...'
+    return text
+
+
+def escape_markup(text):
+    '''Escape the body markup of the notification daemon, when the
+    escape_markup option is on. The history keeps the text as sent.'''
+    if CONFIG['escape_markup']:
+        text = text.replace('&', '&amp;').replace('<', '&lt;').replace(
+            '>', '&gt;')
+    return text
+
+
+def enqueue_for_display(notification, source, title, description, priority,
+                        nick='', server=''):
+    '''Queue a notification with the icon and timeout currently in effect'''
+    is_away = STATE['is_away']
+    icon = icon_candidates(notification, nick, server)
     time_out = 5000
-    if weechat.config_get_plugin('sticky') == 'on':
+    if CONFIG['sticky']:
         time_out = 0
-    if weechat.config_get_plugin('sticky_away') == 'on' and is_away:
+    if CONFIG['sticky_away'] and is_away:
         time_out = 0
-    try:
-        pynotify.init("wee-notifier")
-        wn = pynotify.Notification(title, description, icon)
-        wn.set_urgency(priority)
-        wn.set_timeout(time_out)
-        wn.show()
-    except Exception as error:
-        weechat.prnt('', 'alibnotify: {0}'.format(error))
-
-
-def schedule_decrement(poll_time_m):
-    """Schedule the mute time to be decremented in <poll_time_m> minutes"""
-    weechat.hook_timer(poll_time_m * 1000 * 60, 0, 1, 'decrement_mute_time_cb',
-                       str(poll_time_m))
+    queued = enqueue_notification(
+        (notification, source, title, escape_markup(description), icon,
+         priority, time_out))
+    record_history(notification, source, title, description,
+                   'queued' if queued else 'dropped')
+
+
+def icon_candidates(category, nick, server):
+    '''List the icons which may be used for a notification, best first: the
+    avatar of the nick, then the icon of the category, of the network and
+    the default icon. The delivery worker picks the first existing one.'''
+    candidates = []
+    if CONFIG['icon_dir'] and nick and '/' not in nick:
+        candidates.append('{0}/{1}.png'.format(CONFIG['icon_dir'], nick))
+    icon = CONFIG['icon_category'].get(category.lower())
+    if icon:
+        candidates.append(icon)
+    icon = server and CONFIG['icon_network'].get(server.lower())
+    if icon:
+        candidates.append(icon)
+    if CONFIG['icon']:
+        candidates.append(CONFIG['icon'])
+    return tuple(candidates)
 
 
 def mute(arg_list):
     """Depending on the args passed from the user, either toggle the mute state
     Or set mute to True for N minutes"""
-    # Unhook any previous timers, because we are either unmuting, muting
+    if len(arg_list) == 2 and not (arg_list[1].isdigit() and
+                                   int(arg_list[1]) >= 1):
+        weechat.prnt('', 'alibnotify: the mute timer must be a whole number '
+                     'of minutes, at least 1: {0}'.format(arg_list[1]))
+        return
+    # Unhook any previous timer, because we are either unmuting, muting
     # indefinitely or setting a new timer
-    prev_timer_hook = STATE.get('mute_timer')
+    prev_timer_hook = STATE['mute_timer']
     if prev_timer_hook:
         weechat.unhook(prev_timer_hook)
         weechat.prnt('', 'unhooking previous mute timer, since this is a new '
                      'mute')
-        # If we had a previous timer, also zero out the countdown time
-        STATE['mute_time'] = 0
+        STATE['mute_timer'] = None
+    STATE['mute_deadline'] = None
 
     if len(arg_list) == 1:
         # Just toggle the mute state
         STATE['is_muted'] = not STATE['is_muted']
+        if not STATE['is_muted']:
+            show_mute_digest()
     elif len(arg_list) == 2:
         # A second arg, the time to remain muted, was provided
         time_to_mute = int(arg_list[1])
 
         STATE['is_muted'] = True
 
-        # Store the mute time to be displayed in the status bar item, also
-        # decrement it periodically so the bar item displays a countdown until
-        # notifications will be unmuted
-        STATE['mute_time'] = time_to_mute
-        schedule_decrement(1)
-
-        # Schedule alibnotify to be unmuted after we've hit the requested time
-        timer_hook = weechat.hook_timer(time_to_mute * 1000 * 60, 0, 1,
-                                        'unmute_cb', str(time_to_mute))
-        STATE['mute_timer'] = timer_hook
+        # The bar item counts down to the deadline. A single timer ticks
+        # every minute to refresh it and unmutes on its last call.
+        STATE['mute_deadline'] = MONOTONIC() + time_to_mute * 60
+        STATE['mute_timer'] = weechat.hook_timer(
+            60 * 1000, 0, time_to_mute, 'unmute_cb', str(time_to_mute))
 
     # update bar item to show the current mute state
     weechat.bar_item_update(SCRIPT_NAME)
 
 
+def count_muted(category, source, priority, count=1):
+    '''Count the messages of a notification held back while muted. Once
+    MUTED_MAX sources are counted, further ones are only counted per
+    category.'''
+    key = (category, source)
+    if key not in MUTED and len(MUTED) >= MUTED_MAX:
+        key = (category, '')
+    entry = MUTED.get(key)
+    if entry is None:
+        MUTED[key] = [count, priority]
+    else:
+        entry[0] += count
+        entry[1] = max(entry[1], priority)
+
+
+def show_mute_digest():
+    '''Summarize the notifications held back while muted in one
+    notification and one line of the core buffer.'''
+    if not MUTED:
+        return
+    total = sum(count for count, _ in MUTED.values())
+    priority = max(priority for _, priority in MUTED.values())
+    counts = sorted(MUTED.items(), key=lambda item: -item[1][0])
+    parts = [
+        '{0} {1}{2}'.format(count, category, ' ({0})'.format(source)
+                            if source else '')
+        for (category, source), (count, _) in counts[:MUTED_DIGEST]]
+    if len(counts) > MUTED_DIGEST:
+        parts.append('{0} more'.format(
+            sum(count for _, (count, _) in counts[MUTED_DIGEST:])))
+    MUTED.clear()
+    enqueue_for_display(
+        'WeeChat', '', '{0} Notifications While Muted'.format(total),
+        ', '.join(parts), priority)
+    weechat.prnt('', 'alibnotify: {0} notifications held while muted: '
+                 '{1}'.format(total, ', '.join(parts)))
+
+
+def mute_minutes_left():
+    """Whole minutes until a timed mute ends, or 0 for an untimed one"""
+    deadline = STATE['mute_deadline']
+    if deadline is None:
+        return 0
+    return max(int(math.ceil((deadline - MONOTONIC()) / 60)), 0)
+
+
+# -----------------------------------------------------------------------------
+# Quiet hours
+# -----------------------------------------------------------------------------
+def quiet_hours_state(now):
+    '''Whether quiet hours are in effect at a datetime, and the datetime
+    of the next start or end of quiet hours (None without quiet hours).'''
+    quiet = False
+    next_change = None
+    midnight = datetime.datetime.combine(now.date(), datetime.time())
+    for days, start, length in CONFIG['quiet_hours']:
+        for offset in range(-1, 8):
+            day = midnight + datetime.timedelta(days=offset)
+            if day.weekday() not in days:
+                continue
+            begin = day + datetime.timedelta(minutes=start)
+            end = begin + datetime.timedelta(minutes=length)
+            if begin <= now < end:
+                quiet = True
+            for edge in (begin, end):
+                if edge > now and (next_change is None or edge < next_change):
+                    next_change = edge
+    return quiet, next_change
+
+
+def apply_quiet_hours():
+    '''Update the quiet hours state and arm one timer for the next
+    transition.'''
+    if STATE['quiet_timer']:
+        weechat.unhook(STATE['quiet_timer'])
+        STATE['quiet_timer'] = None
+    now = datetime.datetime.now()
+    quiet, next_change = quiet_hours_state(now)
+    if quiet != STATE['is_quiet']:
+        STATE['is_quiet'] = quiet
+        weechat.bar_item_update(SCRIPT_NAME)
+    if next_change is not None:
+        # Fire a second late, so the transition has happened.
+        delay = next_change - now + datetime.timedelta(seconds=1)
+        STATE['quiet_timer'] = weechat.hook_timer(
+            int(delay.days * 86400000 + delay.seconds * 1000 +
+                delay.microseconds // 1000),
+            0, 1, 'cb_quiet_hours', '')
+
+
+# -----------------------------------------------------------------------------
+# Activity
+# -----------------------------------------------------------------------------
+def refresh_activity():
+    '''Read whether the user typed within idle_threshold seconds.'''
+    threshold = CONFIG['idle_threshold']
+    inactivity = weechat.info_get('inactivity', '')
+    ACTIVITY['active'] = bool(
+        threshold > 0 and inactivity.isdigit() and
+        int(inactivity) < threshold)
+
+
+def apply_idle_threshold():
+    '''Track the focused buffer and the activity of the user while
+    idle_threshold is set, with one timer.'''
+    if ACTIVITY['timer']:
+        weechat.unhook(ACTIVITY['timer'])
+        ACTIVITY['timer'] = None
+    ACTIVITY['buffer'] = weechat.current_buffer()
+    refresh_activity()
+    if CONFIG['idle_threshold'] > 0:
+        ACTIVITY['timer'] = weechat.hook_timer(
+            ACTIVITY_INTERVAL * 1000, 0, 0, 'cb_activity', '')
+
+
+# -----------------------------------------------------------------------------
+# Rate limiting
+# -----------------------------------------------------------------------------
+def take_token(category, source, nick, priority, pointer=None):
+    '''Take a token from the bucket of a category and source. When it is
+    empty, count the message towards a summary and return False.'''
+    if category in RATE_PRIORITY_CATEGORIES:
+        burst = CONFIG['rate_priority_burst']
+    else:
+        burst = CONFIG['rate_burst']
+    if burst <= 0:
+        return True
+    now = MONOTONIC()
+    rate = float(burst) / max(CONFIG['rate_window'], 1)
+    buckets = RATE['buckets']
+    key = (category, source)
+    bucket = buckets.get(key)
+    if bucket is None:
+        if len(buckets) >= RATE_BUCKETS_MAX:
+            prune_buckets(now, rate, burst)
+        bucket = buckets[key] = [float(burst), now]
+    else:
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+        return True
+    summary = RATE['summaries'].get(key)
+    if summary is None:
+        summary = RATE['summaries'][key] = [0, set(), priority, pointer]
+    summary[0] += 1
+    if nick:
+        summary[1].add(nick)
+    if not RATE['timer']:
+        RATE['timer'] = weechat.hook_timer(
+            max(CONFIG['rate_window'], 1) * 1000, 0, 1,
+            'cb_flush_summaries', '')
+    return False
+
+
+def prune_buckets(now, rate, burst):
+    '''Forget the buckets which have refilled completely.'''
+    buckets = RATE['buckets']
+    for key in [key for key, (tokens, last) in buckets.items()
+                if tokens + (now - last) * rate >= burst]:
+        del buckets[key]
+
+
+def flush_summaries():
+    '''Show one summary per source for the messages held back, unless it
+    is held back itself like any other notification.'''
+    summaries = RATE['summaries']
+    while summaries:
+        (category, source), (count, nicks, priority, pointer) = \
+            summaries.popitem(last=False)
+        if nicks:
+            description = '{0} new messages in {1} from {2} nicks'.format(
+                count, source, len(nicks))
+        else:
+            description = '{0} new messages from {1}'.format(count, source)
+        title = '{0} Messages'.format(category)
+        if is_held_back(category, source, title, description, priority,
+                        pointer, count):
+            continue
+        enqueue_for_display(category, source, title, description, priority)
+
+
+# -----------------------------------------------------------------------------
+# History
+# -----------------------------------------------------------------------------
+class HistoryRecord(object):
+    '''A notification kept in the history ring.'''
+
+    __slots__ = ('timestamp', 'category', 'source', 'title', 'body',
+                 'outcome')
+
+    def __init__(self, timestamp, category, source, title, body, outcome):
+        self.timestamp = timestamp
+        self.category = category
+        self.source = source
+        self.title = title
+        self.body = body
+        self.outcome = outcome
+
+    def to_line(self):
+        '''Format the record as one tab separated line.'''
+        return '\t'.join([str(int(self.timestamp)), self.category,
+                          self.source, self.outcome, self.title,
+                          self.body]) + '\n'
+
+    @classmethod
+    def from_line(cls, line):
+        '''Parse a line written by to_line.'''
+        timestamp, category, source, outcome, title, body = \
+            line.rstrip('\n').split('\t', 5)
+        return cls(int(timestamp), category, source, title, body, outcome)
+
+
+def history_text(text, limit):
+    '''Flatten and truncate a field stored in the history.'''
+    text = text[:limit]
+    if '\t' in text or '\n' in text:
+        text = text.replace('\t', ' ').replace('\n', ' ')
+    return text
+
+
+def record_history(category, source, title, description, outcome):
+    '''Add a notification to the history ring, and to the history file.'''
+    records = HISTORY['records']
+    if not records:
+        return
+    record = HistoryRecord(
+        time.time(), category, history_text(source, 64),
+        history_text(title, 64), history_text(description, HISTORY_BODY),
+        outcome)
+    records[HISTORY['next']] = record
+    HISTORY['next'] = (HISTORY['next'] + 1) % len(records)
+    if HISTORY['file'] is not None:
+        try:
+            HISTORY['file'].write(record.to_line())
+            HISTORY['file'].flush()
+        except (IOError, OSError) as error:
+            weechat.prnt('', 'alibnotify: history file: {0}'.format(error))
+            close_history_file()
+
+
+def history_records():
+    '''Return the recorded notifications, oldest first.'''
+    records = HISTORY['records']
+    index = HISTORY['next']
+    return [record for record in records[index:] + records[:index]
+            if record is not None]
+
+
+def resize_history():
+    '''Resize the ring to history_size, keeping the newest records.'''
+    size = max(CONFIG['history_size'], 0)
+    kept = history_records()[-size:] if size else []
+    HISTORY['records'] = kept + [None] * (size - len(kept))
+    HISTORY['next'] = len(kept) % size if size else 0
+
+
+def history_path():
+    '''Expand the history_file option, "%h" being the WeeChat directory.'''
+    return expand_path(CONFIG['history_file'])
+
+
+def open_history_file():
+    '''Replay the history file into the ring, compact it when it has grown
+    well past history_size, and keep it open for appending. The file holds
+    every recorded notification, so the ring is rebuilt from it alone.'''
+    close_history_file()
+    if not CONFIG['history_file'] or not HISTORY['records']:
+        return
+    path = history_path()
+    size = len(HISTORY['records'])
+    HISTORY['records'] = [None] * size
+    HISTORY['next'] = 0
+    try:
+        lines = collections.deque(maxlen=size)
+        total = 0
+        if os.path.exists(path):
+            with open(path) as history_file:
+                for line in history_file:
+                    lines.append(line)
+                    total += 1
+        for line in lines:
+            try:
+                record = HistoryRecord.from_line(line)
+            except ValueError:
+                continue
+            HISTORY['records'][HISTORY['next']] = record
+            HISTORY['next'] = (HISTORY['next'] + 1) % size
+        if total > 2 * size:
+            with open(path, 'w') as history_file:
+                history_file.writelines(lines)
+        HISTORY['file'] = open(path, 'a')
+    except (IOError, OSError) as error:
+        weechat.prnt('', 'alibnotify: history file: {0}'.format(error))
+
+
+def close_history_file():
+    '''Close the history file if it is open.'''
+    if HISTORY['file'] is not None:
+        HISTORY['file'].close()
+        HISTORY['file'] = None
+
+
+def print_history(buffer, arg_list):
+    '''Print the last N recorded notifications, optionally only those
+    containing a filter string.'''
+    count = 10
+    if arg_list and arg_list[0].isdigit():
+        count = int(arg_list[0])
+        arg_list = arg_list[1:]
+    text_filter = ' '.join(arg_list).lower()
+    records = history_records()
+    if text_filter:
+        records = [
+            record for record in records
+            if text_filter in ' '.join([
+                record.category, record.source, record.title, record.body,
+                record.outcome]).lower()]
+    records = records[-count:] if count else []
+    weechat.prnt(buffer, 'alibnotify history ({0} shown):'.format(
+        len(records)))
+    for record in records:
+        weechat.prnt(buffer, '  {0} [{1}] {2}: {3} ({4})'.format(
+            time.strftime('%Y-%m-%d %H:%M:%S',
+                          time.localtime(record.timestamp)),
+            record.category, record.title, record.body, record.outcome))
+
+
+# -----------------------------------------------------------------------------
+# Backends
+# -----------------------------------------------------------------------------
+class IconCache(object):
+    '''Bounded LRU of decoded icons keyed by path. An entry is decoded again
+    only when the modification time of its file changes.'''
+
+    def __init__(self, decode, size):
+        self.decode = decode
+        self.size = max(size, 1)
+        self.entries = collections.OrderedDict()
+
+    def get(self, candidates):
+        '''Return the path and decoded image of the first readable icon
+        among the candidates, or ('', None).'''
+        for path in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.entries.pop(path, None)
+            if entry is None or entry[0] != stat.st_mtime:
+                image = None
+                if stat.st_size <= ICON_MAX_BYTES:
+                    try:
+                        image = self.decode(path)
+                    except Exception:
+                        image = None
+                entry = (stat.st_mtime, image)
+            self.entries[path] = entry
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+            return path, entry[1]
+        return '', None
+
+
+class Backend(object):
+    '''Base class of the delivery backends. Backends only ever run on the
+    delivery worker, and remember the live notifications they showed so a
+    repeated category and source can update them in place.'''
+
+    def __init__(self):
+        self.live = collections.OrderedDict()
+        self.icons = IconCache(self.decode_icon, CONFIG['icon_cache_size'])
+
+    def decode_icon(self, path):
+        '''Decode an icon file into the form show() sends, or return None to
+        send the path only.'''
+        return None
+
+    def show(self, category, source, title, description, icon, priority,
+             time_out):
+        '''Show, or buffer for flush(), a single notification.'''
+        raise NotImplementedError
+
+    def flush(self):
+        '''Send whatever show() buffered. Called once per batch.'''
+
+    def retry_delay(self):
+        '''Seconds until flush() should be retried, or None.'''
+        return None
+
+    def close(self):
+        self.live.clear()
+        self.icons.entries.clear()
+
+    def take_live(self, key, now):
+        '''Pop the live notification of a key, forgetting expired ones.'''
+        live = self.live
+        for expired in [k for k, (_, expires) in live.items()
+                        if expires <= now]:
+            del live[expired]
+        entry = live.pop(key, None)
+        return entry and entry[0]
+
+    def remember_live(self, key, notification, time_out, now):
+        '''Remember a live notification until its bubble times out.'''
+        if not key[1]:
+            return
+        expires = now + (time_out / 1000.0 if time_out else LIVE_TTL)
+        self.live[key] = (notification, expires)
+        while len(self.live) > LIVE_MAX:
+            self.live.popitem(last=False)
+
+
+class LibnotifyBackend(Backend):
+    '''Shows notifications through the pynotify bindings, keeping one
+    initialized session.'''
+
+    def __init__(self):
+        Backend.__init__(self)
+        import pynotify
+        self.pynotify = pynotify
+        pynotify.init("wee-notifier")
+        try:
+            import gtk
+            self.gdk = gtk.gdk
+        except ImportError:
+            self.gdk = None
+
+    def decode_icon(self, path):
+        if self.gdk is None:
+            return None
+        return self.gdk.pixbuf_new_from_file(path)
+
+    def show(self, category, source, title, description, icon, priority,
+             time_out):
+        now = time.time()
+        key = (category, source)
+        path, pixbuf = self.icons.get(icon)
+        if pixbuf is not None:
+            path = ''
+        wn = self.take_live(key, now)
+        if wn:
+            wn.update(title, description, path)
+        else:
+            wn = self.pynotify.Notification(title, description, path)
+            if source:
+                wn.connect('closed', self.cb_closed, key)
+        if pixbuf is not None:
+            wn.set_icon_from_pixbuf(pixbuf)
+        wn.set_urgency(priority)
+        wn.set_timeout(time_out)
+        wn.show()
+        self.remember_live(key, wn, time_out, now)
+
+    def cb_closed(self, notification, key):
+        '''Forget a live notification once its bubble is closed.'''
+        entry = self.live.get(key)
+        if entry and entry[0] is notification:
+            self.live.pop(key, None)
+
+    def close(self):
+        Backend.close(self)
+        self.pynotify.uninit()
+
+
+class DBusBackend(Backend):
+    '''Calls org.freedesktop.Notifications directly over a private session
+    bus connection kept for the lifetime of the backend.'''
+
+    def __init__(self):
+        Backend.__init__(self)
+        import dbus
+        self.dbus = dbus
+        self.bus = dbus.SessionBus(private=True)
+        self.interface = dbus.Interface(
+            self.bus.get_object('org.freedesktop.Notifications',
+                                '/org/freedesktop/Notifications'),
+            'org.freedesktop.Notifications')
+        try:
+            from gi.repository import GdkPixbuf
+            self.pixbuf = GdkPixbuf.Pixbuf
+        except ImportError:
+            self.pixbuf = None
+
+    def decode_icon(self, path):
+        '''Decode an icon into the "image-data" hint: width, height,
+        rowstride, alpha, bits per sample, channels and the pixels.'''
+        if self.pixbuf is None:
+            return None
+        pixbuf = self.pixbuf.new_from_file(path)
+        return self.dbus.Struct((
+            pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride(),
+            pixbuf.get_has_alpha(), pixbuf.get_bits_per_sample(),
+            pixbuf.get_n_channels(),
+            self.dbus.ByteArray(pixbuf.get_pixels())),
+            signature='iiibiiay')
+
+    def show(self, category, source, title, description, icon, priority,
+             time_out):
+        now = time.time()
+        key = (category, source)
+        replaces_id = self.take_live(key, now) or 0
+        path, image_data = self.icons.get(icon)
+        hints = {'urgency': self.dbus.Byte(priority)}
+        if image_data is not None:
+            hints['image-data'] = image_data
+            path = ''
+        notification_id = self.interface.Notify(
+            'wee-notifier', self.dbus.UInt32(replaces_id), path,
+            title, description, self.dbus.Array([], signature='s'),
+            hints, self.dbus.Int32(time_out))
+        self.remember_live(key, int(notification_id), time_out, now)
+
+    def close(self):
+        Backend.close(self)
+        self.bus.close()
+
+
+class SocketBackend(Backend):
+    '''Forwards notifications to a remote receiver (see
+    alibnotify_receiver.py) as length prefixed JSON records over a single
+    kept-alive Unix or TCP connection. Records are buffered while
+    disconnected and the connection is retried with exponential backoff.'''
+
+    BACKOFF_MIN = 1
+    BACKOFF_MAX = 60
+
+    def __init__(self, address, buffer_size):
+        Backend.__init__(self)
+        self.address = address
+        self.pending = collections.deque()
+        self.buffer_size = max(buffer_size, 1)
+        self.sock = None
+        self.backoff = 0
+        self.next_attempt = 0
+
+    def decode_icon(self, path):
+        '''Read an icon to forward it inline, the receiver has no access to
+        the files of this host.'''
+        with open(path, 'rb') as icon_file:
+            return base64.b64encode(icon_file.read()).decode('ascii')
+
+    def show(self, category, source, title, description, icon, priority,
+             time_out):
+        path, icon_data = self.icons.get(icon)
+        record = json.dumps({
+            'category': category,
+            'source': source,
+            'title': title,
+            'body': description,
+            'icon': os.path.basename(path),
+            'icon_data': icon_data,
+            'urgency': priority,
+            'timeout': time_out,
+        }).encode('utf-8')
+        if len(self.pending) >= self.buffer_size:
+            self.pending.popleft()
+            STATS['dropped'] += 1
+        self.pending.append(struct.pack('!I', len(record)) + record)
+
+    def flush(self):
+        if not self.pending or MONOTONIC() < self.next_attempt:
+            return
+        try:
+            if self.sock is None:
+                self.sock = connect_socket(self.address)
+            self.sock.sendall(b''.join(self.pending))
+        except (socket.error, ValueError):
+            # Only report the first failure, not every retry.
+            first_failure = not self.backoff
+            self.disconnect()
+            if first_failure:
+                raise
+            return
+        self.pending.clear()
+        self.backoff = 0
+
+    def disconnect(self):
+        '''Drop the connection and schedule the next attempt.'''
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.backoff = min(max(self.backoff * 2, self.BACKOFF_MIN),
+                           self.BACKOFF_MAX)
+        self.next_attempt = MONOTONIC() + self.backoff
+
+    def retry_delay(self):
+        if not self.pending:
+            return None
+        return max(self.next_attempt - MONOTONIC(), 0.1)
+
+    def close(self):
+        Backend.close(self)
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+def connect_socket(address):
+    '''Connect to a "unix:/path" or "tcp:host:port" address.'''
+    kind, _, target = address.partition(':')
+    if kind == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        target = os.path.expanduser(target)
+    elif kind == 'tcp':
+        host, _, port = target.rpartition(':')
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        target = (host, int(port))
+    else:
+        raise ValueError('invalid socket_address: {0}'.format(address))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    sock.settimeout(5)
+    try:
+        sock.connect(target)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def open_backend():
+    '''Create the backend selected by the backend option.'''
+    name = CONFIG['backend']
+    if name == 'dbus':
+        return DBusBackend()
+    if name == 'socket':
+        return SocketBackend(CONFIG['socket_address'], CONFIG['socket_buffer'])
+    return LibnotifyBackend()
+
+
+# -----------------------------------------------------------------------------
+# Delivery
+# -----------------------------------------------------------------------------
+def enqueue_notification(item):
+    '''Queue a notification for the worker, ordered by urgency and then
+    category. Applies the category quotas and the overflow policy, and
+    returns whether the notification was queued.'''
+    category = item[0]
+    if over_quota(category):
+        STATS['dropped'] += 1
+        return False
+    if category in RATE_PRIORITY_CATEGORIES:
+        priority_class = RATE_PRIORITY_CATEGORIES.index(category)
+    else:
+        priority_class = len(RATE_PRIORITY_CATEGORIES)
+    entry = (priority_class, -item[5],
+             CATEGORY_RANKS.get(category, len(CATEGORY_RANKS)),
+             next(DELIVERY['sequence']), item)
+    cond = DELIVERY['cond']
+    with cond:
+        queue = DELIVERY['queue']
+        if len(queue) >= max(CONFIG['queue_depth'], 1):
+            STATS['dropped'] += 1
+            if CONFIG['queue_overflow'] == 'drop_lowest':
+                # Lowest class, then least urgent, new one included.
+                victim = max(queue)
+                if entry > victim:
+                    return False
+            else:
+                victim = min(queue, key=lambda queued: queued[3])
+            queue.remove(victim)
+            heapq.heapify(queue)
+        heapq.heappush(queue, entry)
+        cond.notify()
+    return True
+
+
+def over_quota(category):
+    '''Count a notification against the quota of its category, returning
+    whether the quota for the current window is used up.'''
+    limit = CONFIG['category_quota'].get(category.lower())
+    if limit is None:
+        return False
+    now = MONOTONIC()
+    if now - QUOTA['window_started'] >= CONFIG['quota_window']:
+        QUOTA['window_started'] = now
+        QUOTA['counts'].clear()
+    used = QUOTA['counts'].get(category, 0)
+    if used >= limit:
+        return True
+    QUOTA['counts'][category] = used + 1
+    return False
+
+
+def delivery_worker(stop, error_fd):
+    '''Hand queued notifications to the backend, most urgent first, until
+    the stop event is set. The backend is opened on the first notification
+    and flushed whenever the queue runs empty. While it cannot be opened,
+    notifications are dropped and the failure is reported only once.
+    Errors are signalled on error_fd, which the worker closes when it
+    exits.'''
+    cond = DELIVERY['cond']
+    queue = DELIVERY['queue']
+    backend = None
+    reported = False
+    retry_at = 0
+    retry_delay = BACKEND_RETRY_MIN
+    while True:
+        with cond:
+            if not stop.is_set() and not queue:
+                cond.wait(backend and backend.retry_delay())
+            if stop.is_set():
+                break
+            item = heapq.heappop(queue)[-1] if queue else None
+        if backend is None and MONOTONIC() >= retry_at:
+            try:
+                backend = open_backend()
+                reported = False
+                retry_delay = BACKEND_RETRY_MIN
+            except Exception as error:
+                if not reported:
+                    report_delivery_error(
+                        '{0} backend unavailable: {1}'.format(
+                            CONFIG['backend'], error), error_fd)
+                    reported = True
+                if isinstance(error, ImportError):
+                    retry_at = float('inf')
+                else:
+                    retry_at = MONOTONIC() + retry_delay
+                    retry_delay = min(retry_delay * 2, BACKEND_RETRY_MAX)
+        if backend is None:
+            if item is not None:
+                STATS['dropped'] += 1
+            continue
+        try:
+            if item is not None:
+                start = PERF_COUNTER()
+                try:
+                    backend.show(*item)
+                    STATS['shown'] += 1
+                except Exception as error:
+                    report_delivery_error(error, error_fd)
+                record_latency('delivery', start)
+            if not queue:
+                backend.flush()
+        except Exception as error:
+            report_delivery_error(error, error_fd)
+    if backend is not None:
+        backend.close()
+    os.close(error_fd)
+
+
+def report_delivery_error(error, error_fd):
+    '''Hand an error to the main thread, the WeeChat API is not thread
+    safe. The read end is gone once the worker has been stopped.'''
+    STATS['errors'] += 1
+    DELIVERY['errors'].append(str(error))
+    try:
+        os.write(error_fd, b'!')
+    except OSError:
+        pass
+
+
+def start_delivery():
+    '''Start a delivery worker and watch its error pipe.'''
+    read_fd, write_fd = os.pipe()
+    DELIVERY['pipe'] = read_fd
+    DELIVERY['fd_hook'] = weechat.hook_fd(
+        read_fd, 1, 0, 0, 'cb_delivery_errors', '')
+    DELIVERY['running'] = True
+    DELIVERY['stop'] = threading.Event()
+    thread = threading.Thread(target=delivery_worker, name=SCRIPT_NAME,
+                              args=(DELIVERY['stop'], write_fd))
+    thread.daemon = True
+    thread.start()
+    DELIVERY['thread'] = thread
+
+
+def stop_delivery():
+    '''Stop the delivery worker, discarding undelivered notifications. A
+    worker still busy in the backend after a second exits on its own once
+    the backend returns.'''
+    cond = DELIVERY['cond']
+    with cond:
+        DELIVERY['running'] = False
+        if DELIVERY['stop'] is not None:
+            DELIVERY['stop'].set()
+            DELIVERY['stop'] = None
+        del DELIVERY['queue'][:]
+        cond.notify_all()
+    if DELIVERY['thread']:
+        DELIVERY['thread'].join(1)
+        DELIVERY['thread'] = None
+    if DELIVERY['fd_hook']:
+        weechat.unhook(DELIVERY['fd_hook'])
+        DELIVERY['fd_hook'] = None
+    if DELIVERY['pipe'] is not None:
+        os.close(DELIVERY['pipe'])
+        DELIVERY['pipe'] = None
+
+
+# -----------------------------------------------------------------------------
+# Profiling
+# -----------------------------------------------------------------------------
+def profiled(function):
+    '''Wrap a function to run under the profiler. Nested calls are left to
+    the outermost wrapper, which enables the profiler once.'''
+    profiler = PROFILE['profiler']
+
+    def wrapper(*args, **kwargs):
+        if PROFILE['depth']:
+            return function(*args, **kwargs)
+        PROFILE['depth'] += 1
+        profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            PROFILE['depth'] -= 1
+    return wrapper
+
+
+def start_profile(buffer, memory):
+    '''Profile the print callback path, and its allocations if memory is
+    set, until stop_profile.'''
+    import cProfile
+    stop_profile()
+    PROFILE['profiler'] = cProfile.Profile()
+    PROFILE['allocations'] = None
+    module = globals()
+    for name in PROFILED_FUNCTIONS:
+        PROFILE['originals'][name] = module[name]
+        module[name] = profiled(module[name])
+    if memory:
+        try:
+            import tracemalloc
+        except ImportError:
+            weechat.prnt(buffer, 'alibnotify: tracemalloc needs Python 3')
+        else:
+            tracemalloc.start()
+            PROFILE['snapshot'] = tracemalloc.take_snapshot()
+    weechat.prnt(buffer, 'alibnotify: profiling started{0}'.format(
+        ' with allocations' if PROFILE['snapshot'] else ''))
+
+
+def stop_profile():
+    '''Put the original functions back, keeping the results for
+    dump_profile. Returns whether profiling was running.'''
+    if not PROFILE['originals']:
+        return False
+    globals().update(PROFILE['originals'])
+    PROFILE['originals'] = {}
+    if PROFILE['snapshot'] is not None:
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, __file__)])
+        PROFILE['allocations'] = snapshot.compare_to(
+            PROFILE['snapshot'].filter_traces(
+                [tracemalloc.Filter(True, __file__)]),
+            'lineno')
+        PROFILE['snapshot'] = None
+        tracemalloc.stop()
+    return True
+
+
+def profile_report():
+    '''Format the functions by cumulative time and the allocation sites.'''
+    import pstats
+    try:
+        from cStringIO import StringIO
+    except ImportError:
+        from io import StringIO
+    stream = StringIO()
+    stats = pstats.Stats(PROFILE['profiler'], stream=stream)
+    stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+    report = stream.getvalue().strip('\n').split('\n')
+    if PROFILE['allocations'] is not None:
+        report += ['', 'Top allocation sites since profiling started:']
+        report += ['  {0}'.format(stat)
+                   for stat in PROFILE['allocations'][:PROFILE_TOP]]
+    return report
+
+
+def dump_profile(buffer, path):
+    '''Write the profile report to a file, or to the alibnotify.profile
+    buffer when no path is given.'''
+    if PROFILE['profiler'] is None:
+        weechat.prnt(buffer, 'alibnotify: nothing profiled yet, start with '
+                     '/alibnotify profile start')
+        return
+    report = profile_report()
+    if path:
+        path = expand_path(path)
+        try:
+            with open(path, 'w') as report_file:
+                report_file.write('\n'.join(report) + '\n')
+        except (IOError, OSError) as error:
+            weechat.prnt(buffer, 'alibnotify: profile: {0}'.format(error))
+            return
+        weechat.prnt(buffer, 'alibnotify: profile written to {0}'.format(
+            path))
+        return
+    name = '{0}.profile'.format(SCRIPT_NAME)
+    report_buffer = weechat.buffer_search('python', name)
+    if not report_buffer:
+        report_buffer = weechat.buffer_new(name, '', '', '', '')
+        weechat.buffer_set(report_buffer, 'title', 'alibnotify profile')
+    weechat.buffer_clear(report_buffer)
+    for line in report:
+        weechat.prnt(report_buffer, line)
+
+
+def profile(buffer, arg_list):
+    '''Handle /alibnotify profile start [memory] | stop | dump [file].'''
+    action = arg_list[:1]
+    if action == ['start']:
+        start_profile(buffer, arg_list[1:] == ['memory'])
+    elif action == ['stop']:
+        if stop_profile():
+            weechat.prnt(buffer, 'alibnotify: profiling stopped')
+    elif action == ['dump']:
+        dump_profile(buffer, ' '.join(arg_list[1:]))
+
+
 # -----------------------------------------------------------------------------
 # Callbacks
 # -----------------------------------------------------------------------------
+def cb_away_status(data, signal, signal_data):
+    '''Track the away state from the RPL_UNAWAY (305) and RPL_NOWAWAY (306)
+    replies.'''
+    STATS['dispatched']['away status'] += 1
+    STATE['is_away'] = signal.endswith('306')
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_xfer_add(data, signal, signal_data):
+    '''Notify on incoming DCC chat and file requests.'''
+    info = xfer_info(signal_data)
+    if info is None:
+        return weechat.WEECHAT_RC_OK
+    xfer_type, status, nick, file_name = info
+    STATS['dispatched']['dcc transfer'] += 1
+    if xfer_type == 'chat_recv':
+        notify_dcc_chat_request(nick)
+    elif xfer_type in XFER_RECV_TYPES:
+        notify_dcc_get_request(nick, file_name)
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_xfer_ended(data, signal, signal_data):
+    '''Notify on ended DCC chats and completed or failed transfers.'''
+    info = xfer_info(signal_data)
+    if info is None:
+        return weechat.WEECHAT_RC_OK
+    xfer_type, status, nick, file_name = info
+    STATS['dispatched']['dcc transfer'] += 1
+    if xfer_type.startswith('chat'):
+        notify_dcc_chat_closed(nick)
+    elif xfer_type in XFER_RECV_TYPES:
+        if status == 'done':
+            notify_dcc_get_completed(file_name)
+        else:
+            notify_dcc_get_failed(file_name)
+    elif status == 'done':
+        notify_dcc_send_completed(file_name)
+    else:
+        notify_dcc_send_failed(file_name)
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_delivery_errors(data, fd):
+    '''Print the errors reported by the delivery worker.'''
+    os.read(int(fd), 512)
+    errors = DELIVERY['errors']
+    while errors:
+        weechat.prnt('', 'alibnotify: {0}'.format(errors.popleft()))
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_flush_summaries(data, remaining_calls):
+    '''Summarize the messages held back by the rate limiter.'''
+    RATE['timer'] = None
+    flush_summaries()
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_buffer_changed(data, signal, signal_data):
+    '''Forget the cached metadata of a renamed, closed or changed buffer.'''
+    BUFFERS.pop(signal_data, None)
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_quiet_hours(data, remaining_calls):
+    '''Start or end quiet hours.'''
+    STATE['quiet_timer'] = None
+    apply_quiet_hours()
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_activity(data, remaining_calls):
+    '''Refresh the activity of the user.'''
+    refresh_activity()
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_focus_changed(data, signal, signal_data):
+    '''Remember the buffer of the current window. Switching buffers or
+    windows is activity too.'''
+    ACTIVITY['buffer'] = weechat.current_buffer()
+    ACTIVITY['active'] = CONFIG['idle_threshold'] > 0
+    return weechat.WEECHAT_RC_OK
+
+
+def cb_shutdown():
+    '''Stop the delivery worker when the script is unloaded.'''
+    stop_delivery()
+    close_history_file()
+    stop_profile()
+    return weechat.WEECHAT_RC_OK
+
+
 def alibnotify_cb(data, buffer, args):
     """Callback for alibnotify command. Current ability includes toggle message
     muting with /alibnotify mute <timer>"""
     arg_list = args.split()
-    if 'mute' in args:
+    if arg_list[:1] == ['mute']:
         mute(arg_list)
+    elif arg_list[:1] == ['history']:
+        print_history(buffer, arg_list[1:])
+    elif arg_list[:1] == ['profile'] and \
+            arg_list[1:2] in (['start'], ['stop'], ['dump']):
+        profile(buffer, arg_list[1:])
+    elif arg_list[:1] == ['stats']:
+        if arg_list[1:] == ['reset']:
+            reset_stats()
+        else:
+            print_stats(buffer)
     else:
         weechat.prnt(buffer, 'Unrecognized arg to /alibnotify!')
         weechat.command(buffer, '/help alibnotify')
@@ -516,10 +2429,17 @@ def alibnotify_cb(data, buffer, args):
 
 def bar_item_build_cb(data, item, window):
     """Update the alibnotify bar item to reflect current state"""
+    if STATE['is_quiet'] and not STATE['is_muted']:
+        return weechat.string_eval_expression(
+            '${color:yellow}notifications: quiet hours', {}, {}, {})
+    if CONFIG['bar_stats'] and not STATE['is_muted']:
+        return 'notifications: {0} shown, {1} held'.format(
+            STATS['shown'], STATS['muted'] + STATS['filtered'])
     if STATE['is_muted']:
         bar_text = 'notifications: muted'
-        if 'mute_time' in STATE and STATE['mute_time'] > 0:
-            bar_text += ' (%dm)' % STATE['mute_time']
+        minutes_left = mute_minutes_left()
+        if minutes_left > 0:
+            bar_text += ' (%dm)' % minutes_left
         # Colour the text red
         bar_text = weechat.string_eval_expression('${color:red}%s' % bar_text,
                                                   {}, {}, {})
@@ -528,25 +2448,17 @@ def bar_item_build_cb(data, item, window):
         return ''
 
 
-def decrement_mute_time_cb(data, remaing_calls):
-    """Reduce mute time state, to create a countdown of sorts. This state is
-    displayed in the alibnotify bar item"""
-    STATE['mute_time'] = STATE['mute_time'] - int(data)
-
-    # update bar item to show the current mute state
-    weechat.bar_item_update(SCRIPT_NAME)
-
-    # Check if we should schedule another decrements
-    if STATE['mute_time'] > 0:
-        schedule_decrement(int(data))
-
-    return weechat.WEECHAT_RC_OK
-
-
-def unmute_cb(data, remaing_calls):
-    """Unset the is_muted state"""
+def unmute_cb(data, remaining_calls):
+    """Refresh the mute countdown, and unset the is_muted state once the
+    timer has run out"""
+    if int(remaining_calls) > 0 and mute_minutes_left() > 0:
+        weechat.bar_item_update(SCRIPT_NAME)
+        return weechat.WEECHAT_RC_OK
     STATE['is_muted'] = False
+    STATE['mute_deadline'] = None
+    STATE['mute_timer'] = None
     weechat.prnt('', 'Unmuting after %sm timer' % data)
+    show_mute_digest()
 
     # update bar item to show that we're unmuted
     weechat.bar_item_update(SCRIPT_NAME)
@@ -561,9 +2473,27 @@ Suspend alibnotify notifications for N minutes with:
 Toggle notification with:
     /alibnotify mute
 
+Notifications are also suspended during the quiet_hours option, e.g.:
+    /set plugins.var.python.alibnotify.quiet_hours "mon-fri 22:00-07:00"
+
+Show counters and latency histograms (or zero them) with:
+    /alibnotify stats [reset]
+
+Show the last N (default 10) notifications, shown or suppressed, optionally
+only those containing a text with:
+    /alibnotify history [N] [text]
+
+Profile the handling of printed lines, optionally with the allocations, and
+write the slowest functions and top allocation sites to a file or to the
+alibnotify.profile buffer with:
+    /alibnotify profile start [memory]
+    /alibnotify profile stop
+    /alibnotify profile dump [file]
+
 """
 
-ALIBNOTIFY_COMMAND_COMPLETION = 'mute'
+ALIBNOTIFY_COMMAND_COMPLETION = (
+    'mute || stats reset || history || profile start|stop|dump')
 
 
 # -----------------------------------------------------------------------------
@@ -575,9 +2505,11 @@ def main():
     for option, value in SETTINGS.items():
         if not weechat.config_is_set_plugin(option):
             weechat.config_set_plugin(option, value)
-    # Initialize.
-    icon = "/usr/share/pixmaps/weechat.xpm"
-    STATE['icon'] = icon
+    load_config()
+    apply_quiet_hours()
+    apply_idle_threshold()
+    resize_history()
+    open_history_file()
     # Register hooks.
     weechat.hook_signal(
         'irc_server_connected',
@@ -588,15 +2520,27 @@ def main():
         'cb_irc_server_disconnected',
         '')
     weechat.hook_signal('upgrade_ended', 'cb_upgrade_ended', '')
-    weechat.hook_print('', '', '', 1, 'cb_process_message', '')
+    weechat.hook_signal('*,irc_in2_305;*,irc_in2_306', 'cb_away_status', '')
+    weechat.hook_signal('xfer_add', 'cb_xfer_add', '')
+    weechat.hook_signal('xfer_ended', 'cb_xfer_ended', '')
+    weechat.hook_config('plugins.var.python.{0}.*'.format(SCRIPT_NAME),
+                        'cb_config_changed', '')
+    for signal in ('buffer_renamed', 'buffer_closing',
+                   'buffer_localvar_added', 'buffer_localvar_changed',
+                   'buffer_localvar_removed'):
+        weechat.hook_signal(signal, 'cb_buffer_changed', '')
+    weechat.hook_signal('buffer_switch;window_switch', 'cb_focus_changed', '')
+    register_print_hooks()
     weechat.hook_command('alibnotify', ALIBNOTIFY_COMMAND_HELP,
                          '', '', ALIBNOTIFY_COMMAND_COMPLETION,
                          'alibnotify_cb', '')
+    start_delivery()
     # Create bar item
     alibnotify_bar_item = weechat.bar_item_new(SCRIPT_NAME,
                                                'bar_item_build_cb', '')
     weechat.prnt('', 'alibnotify bar item: %s' % alibnotify_bar_item)
     STATE['bar_item'] = alibnotify_bar_item
+    STATS['load_time'] = PERF_COUNTER() - LOAD_STARTED
 
 
 if __name__ == '__main__' and IMPORT_OK and weechat.register(
@@ -605,7 +2549,7 @@ if __name__ == '__main__' and IMPORT_OK and weechat.register(
     SCRIPT_VERSION,
     SCRIPT_LICENSE,
     SCRIPT_DESC,
-    '',
+    'cb_shutdown',
     ''
 ):
     main()
@@ -0,0 +1,142 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# alibnotify_receiver.py
+# Copyright NikolasOliveira
+#
+# Receives the notifications forwarded by alibnotify.py's socket backend and
+# shows them on the local desktop. Run it where the desktop is, and point
+# the script's socket_address option at it (through an SSH tunnel for
+# instance):
+#
+#   python alibnotify_receiver.py unix:/run/user/1000/alibnotify.sock
+#   python alibnotify_receiver.py tcp:127.0.0.1:7770 --print
+#
+# Each record is a 4 byte big-endian length followed by that many bytes of
+# UTF-8 JSON with the keys category, source, title, body, icon, icon_data,
+# urgency and timeout. icon_data is the base64 encoded icon file, or null.
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+
+URGENCIES = ('low', 'normal', 'critical')
+ICON_DIR = os.path.join(tempfile.gettempdir(), 'alibnotify-icons')
+
+
+def read_exactly(conn, size):
+    '''Read size bytes from a connection, or None at end of stream.'''
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def read_records(conn):
+    '''Yield the records received on a connection.'''
+    while True:
+        header = read_exactly(conn, 4)
+        if header is None:
+            return
+        body = read_exactly(conn, struct.unpack('!I', header)[0])
+        if body is None:
+            return
+        yield json.loads(body.decode('utf-8'))
+
+
+def print_record(record):
+    print('[{0}] {1}: {2}'.format(
+        record.get('category'), record.get('title'), record.get('body')))
+    sys.stdout.flush()
+
+
+def icon_path(record):
+    '''Store the inline icon of a record in ICON_DIR, named after its
+    content so every icon is only written once, and return its path.'''
+    icon_data = record.get('icon_data')
+    if not icon_data:
+        return None
+    data = base64.b64decode(icon_data)
+    extension = os.path.splitext(record.get('icon') or '')[1]
+    path = os.path.join(
+        ICON_DIR, hashlib.sha1(data).hexdigest() + extension)
+    if not os.path.exists(path):
+        if not os.path.isdir(ICON_DIR):
+            os.makedirs(ICON_DIR)
+        with open(path, 'wb') as icon_file:
+            icon_file.write(data)
+    return path
+
+
+def notify_send_record(record):
+    urgency = URGENCIES[min(max(int(record.get('urgency', 0)), 0), 2)]
+    command = [
+        'notify-send', '-u', urgency, '-t', str(record.get('timeout', 5000)),
+        '-a', 'wee-notifier']
+    icon = icon_path(record)
+    if icon:
+        command += ['-i', icon]
+    # The title and body come from remote users, never parse them as
+    # options.
+    subprocess.call(command + ['--', record.get('title', ''),
+                               record.get('body', '')])
+
+
+def serve_connection(conn, show):
+    try:
+        for record in read_records(conn):
+            show(record)
+    finally:
+        conn.close()
+
+
+def listen(address):
+    '''Listen on a "unix:/path" or "tcp:host:port" address.'''
+    kind, _, target = address.partition(':')
+    if kind == 'unix':
+        target = os.path.expanduser(target)
+        if os.path.exists(target):
+            os.unlink(target)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    elif kind == 'tcp':
+        host, _, port = target.rpartition(':')
+        target = (host, int(port))
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    else:
+        raise ValueError('invalid address: {0}'.format(address))
+    server.bind(target)
+    server.listen(5)
+    return server
+
+
+def main(args):
+    if not args or args[0].startswith('-'):
+        print('usage: alibnotify_receiver.py unix:/path|tcp:host:port '
+              '[--print]')
+        return 2
+    show = notify_send_record
+    if '--print' in args:
+        show = print_record
+    server = listen(args[0])
+    while True:
+        conn, _ = server.accept()
+        thread = threading.Thread(
+            target=serve_connection, args=(conn, show))
+        thread.daemon = True
+        thread.start()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
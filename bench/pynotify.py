@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Minimal stand-in for the pynotify bindings. Shown notifications are
+# counted and kept in SHOWN instead of being sent to a daemon.
+
+URGENCY_LOW = 0
+URGENCY_NORMAL = 1
+URGENCY_CRITICAL = 2
+
+
+SHOWN = []
+_INITTED = [False]
+
+
+def init(app_name):
+    _INITTED[0] = True
+    return True
+
+
+def is_initted():
+    return _INITTED[0]
+
+
+def uninit():
+    _INITTED[0] = False
+
+
+class Notification(object):
+
+    def __init__(self, summary, body='', icon=''):
+        self.summary = summary
+        self.body = body
+        self.icon = icon
+        self.urgency = URGENCY_NORMAL
+        self.timeout = -1
+
+    def update(self, summary, body='', icon=''):
+        self.summary = summary
+        self.body = body
+        self.icon = icon
+        return True
+
+    def set_urgency(self, urgency):
+        self.urgency = urgency
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def set_hint(self, key, value):
+        pass
+
+    def set_icon_from_pixbuf(self, pixbuf):
+        pass
+
+    def connect(self, signal, callback, *data):
+        pass
+
+    def show(self):
+        SHOWN.append((self.summary, self.body))
+        return True
+
+    def close(self):
+        return True
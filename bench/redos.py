@@ -0,0 +1,196 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Fuzz and time the message parsers of alibnotify.py, which run on WeeChat's
+# main thread against text other users control:
+#
+#   python3 bench/redos.py
+#   python3 bench/redos.py --size 65536 --budget-us 20000 --fuzz 20000
+#
+# Two checks, exit status 1 if either fails:
+#
+# - fuzz: random short messages built from the tokens the parsers look for
+#   give the same result as the reference regexes the scanners replaced.
+# - timing: adversarial messages of up to --size characters, crafted to make
+#   backtracking parsers go quadratic, are each handled within --budget-us,
+#   both by the parsers alone and through the print hooks.
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+import weechat  # noqa: E402  (stand-in)
+
+
+# The patterns replaced by parse_topic and parse_ctcp_action. Harmless on
+# short input, so the fuzz pass uses them as the expected behaviour.
+REFERENCE_TOPIC_REGEX = re.compile(
+    r'^\w+ has (?:changed|unset) topic for ([^\s]+)'
+    r'(?:(?: from "(?:(?:"\w|[^"])+)")? to "((?:"\w|[^"])+)")?',
+    re.UNICODE)
+REFERENCE_CTCP_ACTION_REGEX = re.compile(
+    r'^CTCP_MESSAGE.+?ACTION (.+)$', re.UNICODE)
+
+
+# Printed lines never contain newlines, so the fuzz alphabet has none.
+TOPIC_TOKENS = ['"', '"a', 'a', ' ', ' to "', ' from "', '" to "', 'x"',
+                '""', 'é']
+CTCP_TOKENS = ['ACTION ', 'ACTION', 'A', ' ', 'a', 'CTCP_MESSAGE', ':']
+
+
+def reference_topic(message):
+    match = REFERENCE_TOPIC_REGEX.match(message)
+    return match and (match.group(1), match.group(2) or '')
+
+
+def reference_ctcp_action(message):
+    match = REFERENCE_CTCP_ACTION_REGEX.match(message)
+    return match and match.group(1)
+
+
+def fuzz(script, count, seed):
+    '''Compare the scanners with the reference regexes, returning the
+    mismatching messages.'''
+    rng = random.Random(seed)
+    mismatches = []
+    heads = ['bob has changed topic for #c', 'bob has unset topic for #c',
+             'bob has changed topic for']
+    for _ in range(count):
+        message = rng.choice(heads) + ''.join(
+            rng.choice(TOPIC_TOKENS) for _ in range(rng.randint(0, 12)))
+        if script.parse_topic(message) != (reference_topic(message) or None):
+            mismatches.append(('topic', message))
+        message = ''.join(
+            rng.choice(CTCP_TOKENS) for _ in range(rng.randint(0, 8)))
+        if rng.random() < 0.8:
+            message = 'CTCP_MESSAGE' + message
+        if script.parse_ctcp_action(message) != (
+                reference_ctcp_action(message) or None):
+            mismatches.append(('ctcp action', message))
+    return mismatches
+
+
+def adversarial_messages(size):
+    '''Yield (name, print hook tags, prefix, message) for messages crafted
+    against backtracking parsers, about size characters long.'''
+    head = 'bob has changed topic for #c from "'
+    yield ('topic quotes', 'irc_topic', '--', head + '"a' * (size // 2))
+    yield ('topic separators', 'irc_topic', '--',
+           head + 'x" to "' * (size // 7))
+    yield ('topic unclosed', 'irc_topic', '--', head + 'a' * size)
+    yield ('ctcp actions', 'irc_privmsg,notify_private', 'bob',
+           'CTCP_MESSAGE' + 'ACTION a' * (size // 8) + '\n\n')
+    yield ('ctcp no action', 'irc_privmsg,notify_private', 'bob',
+           'CTCP_MESSAGE' + 'ACTIO ' * (size // 6))
+    yield ('notice colons', 'irc_notice,notify_private', '--',
+           'bob ' + ':' * size)
+    yield ('notice spaces', 'irc_notice,notify_private', '--',
+           'bob' + ' a' * (size // 2))
+    yield ('action words', 'irc_privmsg,notify_message', ' *',
+           'a' * size)
+    yield ('invite spaces', 'irc_invite,notify_highlight', '--',
+           'You have been invited to ' + '#c ' * (size // 3))
+    yield ('watchlist', 'irc_privmsg,notify_message', 'bob',
+           'deplo' * (size // 5))
+    yield ('colors', 'irc_privmsg,notify_private', 'bob',
+           '\x0304,0' * (size // 5))
+
+
+def parse(script, message):
+    '''Run every parser over a message.'''
+    script.parse_topic(message)
+    script.parse_ctcp_action(message)
+    script.NOTICE_REGEX.match(message)
+    script.ACTION_REGEX.match(message)
+    script.INVITE_REGEX.match(message)
+    script.WATCHLIST['regex'].search(message.lower())
+    script.normalize_body(message)
+
+
+def fastest(function, repeat):
+    '''Return the fastest of repeated timings of a function, in seconds.
+    The input is the worst case, repeating only filters out noise.'''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        spent = time.perf_counter() - start
+        best = spent if best is None else min(best, spent)
+    return best
+
+
+def timing(script, sizes, repeat):
+    '''Time the parsers and the print hooks on the adversarial messages,
+    returning (name, size, parse seconds, hook seconds) rows.'''
+    weechat.BUFFERS['buffer_fuzz'] = {
+        'name': 'libera.#c', 'short_name': '#c',
+        'localvar_server': 'libera', 'localvar_type': 'channel'}
+    # Repeated lines would be skipped as duplicates before being parsed.
+    script.CONFIG['dedup_cache_size'] = 0
+    rows = []
+    for size in sizes:
+        for name, tags, prefix, message in adversarial_messages(size):
+            parse_time = fastest(lambda: parse(script, message), repeat)
+            hook_time = fastest(
+                lambda: weechat.print_line(
+                    'buffer_fuzz', str(int(time.time())), tags, '0', prefix,
+                    message),
+                repeat)
+            rows.append((name, len(message), parse_time, hook_time))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fuzz and time the message parsers of alibnotify.py.')
+    parser.add_argument('--size', type=int, default=16384,
+                        help='largest adversarial message (default: 16384)')
+    parser.add_argument('--budget-us', type=float, default=5000.0,
+                        help='allowed time per message (default: 5000)')
+    parser.add_argument('--fuzz', type=int, default=5000,
+                        help='random messages to compare (default: 5000)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    import alibnotify
+    weechat.SCRIPT = alibnotify
+    weechat.CONFIG.update({
+        'watchlist': 'deploy,deployment,outage', 'show_public_message': 'off',
+        'show_public_action_message': 'on', 'show_notice_message': 'on',
+        'rate_burst': '0', 'playback_max_age': '0'})
+    alibnotify.main()
+
+    failed = False
+    mismatches = fuzz(alibnotify, args.fuzz, args.seed)
+    print('fuzz: {0} messages, {1} mismatches'.format(
+        args.fuzz * 2, len(mismatches)))
+    for kind, message in mismatches[:10]:
+        print('  {0}: {1!r}'.format(kind, message))
+    failed = failed or bool(mismatches)
+
+    sizes = sorted(set([1024, args.size // 4, args.size]))
+    budget = args.budget_us / 1e6
+    print('{0:18} {1:>8} {2:>12} {3:>12}'.format(
+        'message', 'chars', 'parse us', 'hooks us'))
+    for name, size, parse_time, hook_time in timing(
+            alibnotify, sizes, args.repeat):
+        over = max(parse_time, hook_time) > budget
+        failed = failed or over
+        print('{0:18} {1:>8} {2:>12.1f} {3:>12.1f}{4}'.format(
+            name, size, parse_time * 1e6, hook_time * 1e6,
+            '  OVER BUDGET' if over else ''))
+
+    alibnotify.stop_delivery()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Replay recorded or synthetic IRC traffic through alibnotify.py using the
+# weechat/pynotify stand-ins in this directory, and report the cost of the
+# print callback path:
+#
+#   python3 bench/replay.py --lines 50000
+#   python3 bench/replay.py --input traffic.tsv --json > result.json
+#
+# Recorded traffic is one line per printed message, tab separated:
+#
+#   buffer name<TAB>tags<TAB>highlight<TAB>prefix<TAB>message
+#
+# e.g. "libera.#ops<TAB>irc_privmsg,notify_message<TAB>0<TAB>bob<TAB>hi".
+# Lines of the core buffer use the buffer name "weechat".
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+import pynotify  # noqa: E402  (stand-in)
+import weechat  # noqa: E402  (stand-in)
+
+
+NICKS = ['alice', 'bob', 'carol', 'dave', 'erin', 'frank', 'grace', 'heidi']
+CHANNELS = ['#ops', '#dev', '#devops', '#random', '#support', '#infra']
+WORDS = ('the deploy of build is done failed on host api queue lag restart '
+         'please check ticket OPS-1234 db-01 now thanks').split()
+
+
+def synthetic_traffic(count, seed):
+    '''Yield (buffer name, tags, highlight, prefix, message) records for a
+    mix of channel chatter, highlights, private messages, notices, topics,
+    invites, xfer lines and lines no notification cares about.'''
+    rng = random.Random(seed)
+    for _ in range(count):
+        nick = rng.choice(NICKS)
+        channel = 'libera.' + rng.choice(CHANNELS)
+        text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+        roll = rng.random()
+        if roll < 0.60:
+            yield (channel, 'irc_privmsg,notify_message,nick_' + nick, '0',
+                   nick, text)
+        elif roll < 0.65:
+            yield (channel, 'irc_privmsg,notify_message,nick_' + nick, '1',
+                   nick, 'me: ' + text)
+        elif roll < 0.70:
+            yield (channel, 'irc_privmsg,notify_message,nick_' + nick, '0',
+                   ' *', nick + ' ' + text)
+        elif roll < 0.75:
+            yield ('libera.' + nick, 'irc_privmsg,notify_private,nick_' + nick,
+                   '0', nick, text)
+        elif roll < 0.78:
+            yield ('server.libera', 'irc_notice,notify_private,nick_' + nick,
+                   '0', '--', '{0} (~{0}@host): {1}'.format(nick, text))
+        elif roll < 0.80:
+            yield (channel, 'irc_topic', '0', '--',
+                   '{0} has changed topic for {1} from "old" to "{2}"'.format(
+                       nick, channel.split('.', 1)[1], text))
+        elif roll < 0.81:
+            yield ('server.libera', 'irc_invite,notify_highlight', '0', '--',
+                   'You have been invited to #secret by ' + nick)
+        elif roll < 0.83:
+            yield ('weechat', '', '0', '',
+                   'xfer: file report.txt received from {0}: OK'.format(nick))
+        else:
+            yield (channel, 'irc_join,nick_' + nick, '0', '-->',
+                   '{0} (~{0}@host) has joined {1}'.format(
+                       nick, channel.split('.', 1)[1]))
+
+
+def recorded_traffic(path):
+    '''Yield the records of a recorded traffic file.'''
+    with open(path) as traffic:
+        for line in traffic:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) == 5:
+                yield tuple(fields)
+
+
+def buffer_pointer(name):
+    '''Return the stand-in buffer for a buffer name, creating it.'''
+    if name == 'weechat':
+        return 'core'
+    pointer = 'buffer_' + name
+    if pointer not in weechat.BUFFERS:
+        server, _, short_name = name.partition('.')
+        if server == 'server':
+            server, short_name = short_name, name
+            buffer_type = 'server'
+        elif short_name.startswith('#'):
+            buffer_type = 'channel'
+        else:
+            buffer_type = 'private'
+        weechat.BUFFERS[pointer] = {
+            'name': name,
+            'short_name': short_name,
+            'localvar_server': server,
+            'localvar_type': buffer_type,
+        }
+    return pointer
+
+
+def load_script(settings):
+    '''Import alibnotify with the stand-ins and run its main().'''
+    import alibnotify
+    weechat.SCRIPT = alibnotify
+    weechat.CONFIG.update(settings)
+    alibnotify.main()
+    return alibnotify
+
+
+def count_enqueued(script):
+    '''Count the notifications handed to the delivery queue.'''
+    counter = [0]
+    enqueue = script.enqueue_notification
+
+    def counting_enqueue(*args, **kwargs):
+        counter[0] += 1
+        return enqueue(*args, **kwargs)
+
+    script.enqueue_notification = counting_enqueue
+    return counter
+
+
+def drain(script, timeout=5.0):
+    '''Wait for the delivery worker to empty its queue.'''
+    deadline = time.time() + timeout
+    while script.DELIVERY['queue'] and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+
+def replay(records):
+    '''Print every record, returning the script time spent per line and the
+    number of callbacks made.'''
+    latencies = []
+    callbacks = 0
+    date = str(int(time.time()))
+    for name, tags, highlight, prefix, message in records:
+        spent, calls = weechat.print_line(
+            buffer_pointer(name), date, tags, highlight, prefix, message)
+        latencies.append(spent)
+        callbacks += calls
+    return latencies, callbacks
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay IRC traffic through alibnotify.py.')
+    parser.add_argument('--input', help='recorded traffic file (TSV)')
+    parser.add_argument('--lines', type=int, default=20000,
+                        help='synthetic lines to generate (default: 20000)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='OPTION=VALUE',
+                        help='set a plugin option before loading')
+    parser.add_argument('--no-alloc', action='store_true',
+                        help='skip the tracemalloc pass')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args()
+
+    settings = dict(item.split('=', 1) for item in args.set)
+    if args.input:
+        records = list(recorded_traffic(args.input))
+    else:
+        records = list(synthetic_traffic(args.lines, args.seed))
+
+    script = load_script(settings)
+    enqueued = count_enqueued(script)
+
+    start = time.perf_counter()
+    latencies, callbacks = replay(records)
+    wall = time.perf_counter() - start
+    weechat.run_timers()
+
+    result = {
+        'lines': len(records),
+        'callbacks': callbacks,
+        'wall_seconds': wall,
+        'lines_per_second': len(records) / wall if wall else 0.0,
+        'script_seconds': sum(latencies),
+    }
+    latencies.sort()
+    for name, fraction in (('p50', 0.50), ('p99', 0.99), ('max', 1.0)):
+        result['latency_{0}_us'.format(name)] = \
+            percentile(latencies, fraction) * 1e6
+    drain(script)
+    result['notifications_enqueued'] = enqueued[0]
+    result['notifications_shown'] = len(pynotify.SHOWN)
+
+    if not args.no_alloc:
+        # Second pass with tracing on, so it doesn't skew the timings.
+        tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+        before = tracemalloc.get_traced_memory()[0]
+        replay(records)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        lines = float(len(records) or 1)
+        result['alloc_peak_bytes_per_line'] = (peak - before) / lines
+        result['retained_bytes_per_line'] = (current - before) / lines
+        result['retained_blocks_per_line'] = \
+            (sys.getallocatedblocks() - blocks) / lines
+
+    script.stop_delivery()
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        for key in sorted(result):
+            value = result[key]
+            if isinstance(value, float):
+                value = '{0:.2f}'.format(value)
+            print('{0:28} {1}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+#
+# Minimal stand-in for the WeeChat scripting API, good enough to load
+# alibnotify.py outside WeeChat and replay traffic through its hooks.
+#
+# Hooks are recorded instead of registered. print_line() routes a line to
+# the matching print hooks the way WeeChat does (buffer, tags with "," for
+# "or" and "+" for "and", case insensitive message substring) and calls the
+# script callbacks by name, so narrowing the hooks shows up in benchmarks.
+
+import time
+
+
+WEECHAT_RC_OK = 0
+WEECHAT_RC_OK_EAT = 2
+WEECHAT_RC_ERROR = -1
+
+WEECHAT_HOOK_SIGNAL_STRING = 'string'
+WEECHAT_HOOK_SIGNAL_INT = 'int'
+WEECHAT_HOOK_SIGNAL_POINTER = 'pointer'
+
+
+# Module whose functions are called back, set by the caller.
+SCRIPT = None
+
+CONFIG = {}
+BUFFERS = {'core': {'name': 'weechat', 'short_name': 'weechat'}}
+INFOS = {'inactivity': '0'}
+INFOLISTS = {}
+PRINTED = []
+HOOKS = {}
+CURRENT_BUFFER = ['core']
+_COUNTER = [0]
+
+
+def _new_hook(kind, *args):
+    _COUNTER[0] += 1
+    pointer = '0x{0:x}'.format(_COUNTER[0])
+    HOOKS[pointer] = (kind, args)
+    return pointer
+
+
+def _call(name, *args):
+    return getattr(SCRIPT, name)(*args)
+
+
+# -----------------------------------------------------------------------------
+# Script and config
+# -----------------------------------------------------------------------------
+def register(*args):
+    return 1
+
+
+def config_get_plugin(option):
+    return CONFIG.get(option, '')
+
+
+def config_is_set_plugin(option):
+    return int(option in CONFIG)
+
+
+def config_set_plugin(option, value):
+    CONFIG[option] = value
+    for kind, args in list(HOOKS.values()):
+        if kind == 'config':
+            _call(args[1], args[2],
+                  'plugins.var.python.alibnotify.' + option, value)
+    return 1
+
+
+def config_set_desc_plugin(option, description):
+    pass
+
+
+# -----------------------------------------------------------------------------
+# Output
+# -----------------------------------------------------------------------------
+def prnt(buffer, message):
+    PRINTED.append((buffer, message))
+
+
+def prnt_date_tags(buffer, date, tags, message):
+    PRINTED.append((buffer, message))
+
+
+def command(buffer, command):
+    return WEECHAT_RC_OK
+
+
+def string_remove_color(string, replacement):
+    return string
+
+
+def string_eval_expression(expression, pointers, extra_vars, options):
+    return expression
+
+
+def color(name):
+    return ''
+
+
+# -----------------------------------------------------------------------------
+# Buffers, infos and infolists
+# -----------------------------------------------------------------------------
+def buffer_search_main():
+    return 'core'
+
+
+def buffer_search(plugin, name):
+    for pointer, properties in BUFFERS.items():
+        if properties.get('name') == name:
+            return pointer
+    return ''
+
+
+def buffer_new(name, input_callback, input_data, close_callback, close_data):
+    pointer = 'buffer_{0}'.format(name)
+    BUFFERS[pointer] = {'name': name, 'short_name': name}
+    return pointer
+
+
+def buffer_clear(buffer):
+    pass
+
+
+def buffer_set(buffer, property, value):
+    pass
+
+
+def buffer_get_string(buffer, property):
+    return BUFFERS.get(buffer, {}).get(property, '')
+
+
+def current_buffer():
+    return CURRENT_BUFFER[0]
+
+
+def info_get(name, arguments):
+    return INFOS.get(name, '')
+
+
+def infolist_get(name, pointer, arguments):
+    return pointer
+
+
+def infolist_next(infolist):
+    return 1
+
+
+def infolist_string(infolist, field):
+    return str(INFOLISTS.get(infolist, {}).get(field, ''))
+
+
+def infolist_integer(infolist, field):
+    return int(INFOLISTS.get(infolist, {}).get(field, 0))
+
+
+def infolist_free(infolist):
+    pass
+
+
+# -----------------------------------------------------------------------------
+# Hooks
+# -----------------------------------------------------------------------------
+def hook_print(buffer, tags, message, strip_colors, callback, data):
+    return _new_hook('print', buffer, tags, message, callback, data)
+
+
+def hook_signal(signal, callback, data):
+    return _new_hook('signal', signal, callback, data)
+
+
+def hook_config(option, callback, data):
+    return _new_hook('config', option, callback, data)
+
+
+def hook_command(command, description, args, args_description, completion,
+                 callback, data):
+    return _new_hook('command', command, callback, data)
+
+
+def hook_timer(interval, align_second, max_calls, callback, data):
+    return _new_hook('timer', interval, max_calls, callback, data)
+
+
+def hook_fd(fd, read, write, exception, callback, data):
+    return _new_hook('fd', fd, callback, data)
+
+
+def unhook(hook):
+    HOOKS.pop(hook, None)
+
+
+def bar_item_new(name, callback, data):
+    return _new_hook('bar_item', name, callback, data)
+
+
+def bar_item_update(name):
+    pass
+
+
+# -----------------------------------------------------------------------------
+# Driving the script
+# -----------------------------------------------------------------------------
+def _tags_match(hook_tags, line_tags):
+    if not hook_tags:
+        return True
+    for alternative in hook_tags.split(','):
+        if all(tag in line_tags for tag in alternative.split('+')):
+            return True
+    return False
+
+
+def print_line(buffer, date, tags, highlight, prefix, message):
+    '''Route a printed line to the matching print hooks. Returns the
+    seconds spent in script callbacks and the number of callbacks made.'''
+    line_tags = set(tags.split(',')) if tags else set()
+    spent = 0.0
+    calls = 0
+    for kind, args in list(HOOKS.values()):
+        if kind != 'print':
+            continue
+        hook_buffer, hook_tags, hook_message, callback, data = args
+        if hook_buffer and hook_buffer != buffer:
+            continue
+        if hook_message and hook_message.lower() not in message.lower():
+            continue
+        if not _tags_match(hook_tags, line_tags):
+            continue
+        start = time.perf_counter()
+        _call(callback, data, buffer, date, tags, '1', highlight, prefix,
+              message)
+        spent += time.perf_counter() - start
+        calls += 1
+    return spent, calls
+
+
+def send_signal(signal, signal_data):
+    '''Call the callbacks of the signal hooks matching a signal.'''
+    for kind, args in list(HOOKS.values()):
+        if kind != 'signal':
+            continue
+        for pattern in args[0].split(';'):
+            if pattern == signal or (
+                    pattern.startswith('*') and signal.endswith(pattern[1:])):
+                _call(args[1], args[2], signal, signal_data)
+                break
+
+
+def run_command(command, args):
+    '''Call the callback of a script command.'''
+    for kind, hook_args in list(HOOKS.values()):
+        if kind == 'command' and hook_args[0] == command:
+            return _call(hook_args[1], hook_args[2], 'core', args)
+    return WEECHAT_RC_ERROR
+
+
+def run_timers():
+    '''Fire every pending timer once, dropping the one-shot timers.'''
+    for pointer, (kind, args) in list(HOOKS.items()):
+        if kind != 'timer' or pointer not in HOOKS:
+            continue
+        interval, max_calls, callback, data = args
+        if max_calls == 1:
+            HOOKS.pop(pointer, None)
+        _call(callback, data, '0')